@@ -0,0 +1,160 @@
+import datetime
+import logging
+from bisect import bisect_left, insort
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+
+class TotalsSnapshot(NamedTuple):
+    """
+    Read-only copy of the totals of a day, {app: seconds}.
+    """
+    day: datetime.date
+    apps: Mapping[str, int]
+
+
+class Leaderboard:
+    """
+    Apps ranked by tracked seconds, most time first.
+
+    The ranking is kept as a sorted list of (-seconds, app) keys and updated
+    with a bisect per change, so one app gaining time never re-sorts the others
+    and a top-N query only slices the first N entries. Changes are made on a
+    copy of the list that then replaces it, so readers on other threads always
+    see a complete ranking.
+    """
+
+    def __init__(self, totals: Optional[dict[str, int]] = None) -> None:
+        self._keys = sorted((-seconds, app) for app, seconds in (totals or {}).items())
+
+    def update(self, app: str, old_seconds: int, new_seconds: int) -> None:
+        """
+        Move an app from its old total to its new total.
+
+        :param app: str
+        :param old_seconds: int, None if the app was not ranked yet
+        :param new_seconds: int
+        :return: None
+        """
+        keys = self._keys[:]
+        if old_seconds is not None:
+            del keys[bisect_left(keys, (-old_seconds, app))]
+        insort(keys, (-new_seconds, app))
+        # Replacing the reference is atomic, readers get the old or the new ranking
+        self._keys = keys
+
+    def top(self, n: Optional[int] = None) -> list[tuple[str, int]]:
+        """
+        Get the n apps with the most tracked time, all apps if n is None.
+
+        :param n: int
+        :return: list of (app, seconds) pairs
+        """
+        # The list is never changed in place, see update()
+        keys = self._keys if n is None else self._keys[:n]
+        return [(app, -seconds) for seconds, app in keys]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class TimeAccumulator:
+    """
+    Per-app time totals charged between focus transitions.
+
+    Instead of adding a whole second per sample, the time between two
+    transitions is charged to the app that was focused during that interval.
+    Timestamps are time.monotonic_ns() values, so wall clock adjustments can't
+    make an interval negative or stretch it. Every app keeps its exact total in
+    nanoseconds, totals exposes the whole seconds of it.
+    """
+
+    def __init__(self, totals: Optional[dict[str, int]] = None) -> None:
+        self.totals = {app: int(seconds) for app, seconds in (totals or {}).items()}
+        self.leaderboard = Leaderboard(self.totals)
+        self.current_app = None
+        self.since = None
+        # Seconds charged since the last flush
+        self.dirty = 0
+        self._ns = {app: seconds * utils.NS_PER_SECOND for app, seconds in self.totals.items()}
+
+    def charge(self, now_ns: int) -> None:
+        """
+        Charge the time since the last charge to the current app.
+
+        :param now_ns: monotonic timestamp in nanoseconds
+        :return: None
+        """
+        if self.current_app is not None and self.since is not None and now_ns > self.since:
+            app = self.current_app
+            self._ns[app] = self._ns.get(app, 0) + now_ns - self.since
+            old_seconds = self.totals.get(app)
+            seconds = self._ns[app] // utils.NS_PER_SECOND
+            if seconds > (old_seconds or 0):
+                self.totals[app] = seconds
+                self.leaderboard.update(app, old_seconds, seconds)
+                self.dirty += seconds - (old_seconds or 0)
+        self.since = now_ns
+
+    def resume(self, now_ns: int) -> None:
+        """
+        Continue charging the current app from now_ns without charging the time before it.
+
+        Used after the machine was suspended.
+
+        :param now_ns: monotonic timestamp in nanoseconds
+        :return: None
+        """
+        self.since = now_ns
+
+    def switch(self, app: Optional[str], timestamp_ns: int) -> None:
+        """
+        Close the interval of the current app and start charging the new one.
+
+        Passing None stops charging until the next switch.
+
+        :param app: str or None
+        :param timestamp_ns: monotonic timestamp in nanoseconds
+        :return: None
+        """
+        self.charge(timestamp_ns)
+        self.current_app = app
+
+    def seconds(self, app: str) -> int:
+        """
+        Whole seconds charged to the app so far.
+
+        :param app: str
+        :return: int
+        """
+        return self.totals.get(app, 0)
+
+    def nanoseconds(self, app: str) -> int:
+        """
+        Exact time charged to the app so far, in nanoseconds.
+
+        :param app: str
+        :return: int
+        """
+        return self._ns.get(app, 0)
+
+    def snapshot(self, day: datetime.date) -> TotalsSnapshot:
+        """
+        Take a read-only copy of the totals that can be shared with other threads.
+
+        :param day: datetime.date
+        :return: TotalsSnapshot
+        """
+        return TotalsSnapshot(day, MappingProxyType(dict(self.totals)))
+
+    def mark_clean(self) -> None:
+        """
+        Reset the dirty counter after the totals were persisted.
+
+        :return: None
+        """
+        self.dirty = 0
@@ -0,0 +1,82 @@
+import json
+import logging
+from typing import Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedTimeClient:
+    """
+    HTTP client of the tracked time server.
+
+    All calls share one requests.Session, so connections are kept alive and
+    pooled instead of being set up again for every request. Every request has a
+    (connect, read) timeout. Connection errors and 502/503/504 responses are
+    retried with exponential backoff. POST is retried too, the auth endpoints,
+    the sequence numbered deltas and the max-merging bulk upload are safe to
+    repeat. Request bodies are built in full before sending, so a retry sends
+    the same body again.
+    """
+
+    def __init__(self, base_url: str = 'http://127.0.0.1:8000', timeout: tuple[float, float] = (3.05, 10),
+                 retries: int = 3, backoff_factor: float = 0.5, pool_size: int = 4) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, path: str, jwt: str = None, **kwargs) -> requests.Response:
+        """
+        Send a request to a path of the server.
+
+        :param method: str, the HTTP method
+        :param path: str, the path starting with /
+        :param jwt: str, the access token sent as a bearer token
+        :param kwargs: passed to requests.Session.request
+        :return: requests.Response
+        """
+        if jwt is not None:
+            kwargs.setdefault('headers', {})['Authorization'] = f'Bearer {jwt}'
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, self.base_url + path, **kwargs)
+
+    def obtain_token(self, username: str, password: str) -> requests.Response:
+        return self.request('POST', '/auth/api/token/', data={'username': username, 'password': password})
+
+    def verify_token(self, jwt: str) -> requests.Response:
+        return self.request('POST', '/auth/api/token/verify/', data={'token': jwt})
+
+    def refresh_token(self, jwt_refresh: str) -> requests.Response:
+        return self.request('POST', '/auth/api/token/refresh/', data={'refresh': jwt_refresh})
+
+    def register(self, payload: dict) -> requests.Response:
+        return self.request('POST', '/auth/api/register/', data=payload)
+
+    def post_delta(self, jwt: str, delta: dict) -> requests.Response:
+        return self.request('POST', '/api/trackedtime/delta/', jwt=jwt, json=delta)
+
+    def post_days(self, jwt: str, records: Iterable[dict]) -> requests.Response:
+        """
+        Create or merge many days in one request.
+
+        The records are sent as NDJSON. The server keeps the larger time of
+        every app, so the request is safe to retry.
+
+        :param jwt: str
+        :param records: iterable of {'date': 'yyyy-mm-dd', 'apps': {app: 'hh:mm:ss'}}
+        :return: requests.Response with the status of every record
+        """
+        body = b''.join(json.dumps(record).encode() + b'\n' for record in records)
+        return self.request('POST', '/api/trackedtime/bulk/', jwt=jwt, data=body,
+                            headers={'Content-Type': 'application/x-ndjson'})
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,78 @@
+import time
+import logging
+import threading
+from typing import Optional
+
+import keyring
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialStore:
+    """
+    In-memory cache of the credentials kept in keyring.
+
+    Every keyring call can be an IPC round trip to the credential manager or
+    the secret service daemon, and may block on it. Each credential is read
+    from keyring once and then served from memory, a write only reaches keyring
+    when the value actually changed. The duration of every keyring call is
+    logged, calls slower than slow_call seconds as warnings.
+    """
+
+    def __init__(self, service: str = 'time_tracker', slow_call: float = 0.5) -> None:
+        self.service = service
+        self.slow_call = slow_call
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _timed(self, action: str, name: str, call, *args):
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            message = f'keyring {action} of {self.service}/{name} took {elapsed * 1000:.1f}ms'
+            if elapsed >= self.slow_call:
+                logger.warning(message)
+            else:
+                logger.debug(message)
+
+    def get(self, name: str) -> Optional[str]:
+        """
+        Get a credential, keyring is only read the first time.
+
+        :param name: str
+        :return: The credential, None if it is not set
+        """
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = self._timed('read', name, keyring.get_password, self.service, name)
+            return self._values[name]
+
+    def set(self, name: str, value: str) -> bool:
+        """
+        Set a credential, keyring is only written if the value changed.
+
+        :param name: str
+        :param value: str
+        :return: True if keyring was written
+        """
+        with self._lock:
+            if name in self._values and self._values[name] == value:
+                return False
+            self._timed('write', name, keyring.set_password, self.service, name, value)
+            self._values[name] = value
+            return True
+
+    def invalidate(self, name: str = None) -> None:
+        """
+        Forget cached credentials so the next get() reads keyring again.
+
+        :param name: str, all credentials by default
+        :return: None
+        """
+        with self._lock:
+            if name is None:
+                self._values.clear()
+            else:
+                self._values.pop(name, None)
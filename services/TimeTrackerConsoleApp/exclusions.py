@@ -0,0 +1,86 @@
+import os
+import re
+import json
+import time
+import fnmatch
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def compile_rules(rules: dict) -> re.Pattern:
+    """
+    Compile exclusion rules into a single case-insensitive pattern.
+
+    Rules format:
+        {"exact": [names], "glob": [patterns], "regex": [patterns]}
+
+    :param rules: dict
+    :return: re.Pattern matching excluded app names, or None if there are no rules
+    """
+    parts = [re.escape(name.strip()) for name in rules.get('exact', [])]
+    parts += [fnmatch.translate(pattern.strip()) for pattern in rules.get('glob', [])]
+    parts += [f'(?:{pattern})' for pattern in rules.get('regex', [])]
+    if not parts:
+        return None
+    return re.compile('|'.join(f'(?:{part})' for part in parts), re.IGNORECASE)
+
+
+class ExclusionRules:
+    """
+    Apps that are not tracked, loaded from a JSON config file.
+
+    Exact names, globs and regexes are compiled once into one matcher and
+    results are memoized per app name. The file is reloaded when its
+    modification time changes, checked at most every reload_interval seconds.
+    """
+
+    def __init__(self, file_path: str, reload_interval: float = 5) -> None:
+        self.file_path = file_path
+        self.reload_interval = reload_interval
+        self._pattern = None
+        self._matches = {}
+        self._mtime = None
+        self._last_check = None
+        self.reload()
+
+    def reload(self) -> None:
+        """
+        Load the rules file again, keeping the old rules if it is invalid.
+
+        :return: None
+        """
+        first_load = self._last_check is None
+        self._last_check = time.monotonic()
+        try:
+            mtime = os.stat(self.file_path).st_mtime
+        except FileNotFoundError:
+            if first_load or self._mtime is not None:
+                logger.warning(f'Exclusions file {self.file_path} not found, tracking all apps')
+            self._pattern, self._matches, self._mtime = None, {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.file_path, 'r') as f:
+                pattern = compile_rules(json.load(f))
+        except (ValueError, re.error) as e:
+            logger.error(f'Failed to load exclusions from {self.file_path}: {str(e)}')
+            return
+        self._pattern, self._matches, self._mtime = pattern, {}, mtime
+        logger.info(f'Loaded exclusions from {self.file_path}')
+
+    def is_excluded(self, app: str) -> bool:
+        """
+        Check whether the app must not be tracked.
+
+        :param app: str
+        :return: bool
+        """
+        if time.monotonic() - self._last_check >= self.reload_interval:
+            self.reload()
+        excluded = self._matches.get(app)
+        if excluded is None:
+            excluded = self._pattern is not None and self._pattern.fullmatch(app) is not None
+            self._matches[app] = excluded
+        return excluded
@@ -0,0 +1,67 @@
+import time
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class IdleSource(ABC):
+    """
+    Source of the time since the last user input.
+    """
+
+    @abstractmethod
+    def idle_seconds(self) -> float:
+        """
+        Seconds since the last keyboard or mouse input.
+
+        :return: float
+        """
+
+
+class NeverIdleSource(IdleSource):
+    """
+    Idle source for setups without input information, the user is always active.
+    """
+
+    def idle_seconds(self) -> float:
+        return 0.0
+
+
+class WindowsIdleSource(IdleSource):
+    """
+    Idle source backed by GetLastInputInfo.
+    """
+
+    def __init__(self) -> None:
+        # Imported here so the rest of the tracker can run without pywin32
+        import win32api
+        self._win32api = win32api
+
+    def idle_seconds(self) -> float:
+        # Both tick counts are 32-bit and wrap around after ~49 days
+        elapsed = (self._win32api.GetTickCount() - self._win32api.GetLastInputInfo()) & 0xFFFFFFFF
+        return elapsed / 1000
+
+
+class ScriptedIdleSource(IdleSource):
+    """
+    Fake idle source that replays a scripted list of input timestamps.
+
+    clock is the function returning the current time, usually the now() method
+    of a ScriptedWindowSource so both sources share the same virtual time.
+    Before the first scripted input the user counts as active.
+    """
+
+    def __init__(self, inputs: list[float], clock: Callable[[], float] = time.time) -> None:
+        self._inputs = sorted(inputs)
+        self._clock = clock
+
+    def idle_seconds(self) -> float:
+        now = self._clock()
+        position = bisect_right(self._inputs, now)
+        if position == 0:
+            return 0.0
+        return now - self._inputs[position - 1]
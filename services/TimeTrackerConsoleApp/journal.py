@@ -0,0 +1,265 @@
+import os
+import re
+import glob
+import struct
+import datetime
+import logging
+from typing import NamedTuple, Optional
+
+import utils
+from storage import build_day_data
+
+logger = logging.getLogger(__name__)
+
+# Every record except app name definitions has the same fixed layout:
+# kind (1 byte), value (8 byte integer), app id (2 bytes)
+RECORD = struct.Struct('<cqH')
+# An app name definition is the kind byte followed by the name length and the UTF-8 name
+NAME_HEADER = struct.Struct('<cH')
+
+# Defines the next app id, ids start at 1, 0 means "no app"
+KIND_NAME = b'N'
+# Timestamps are time.monotonic_ns() values of the tracker process.
+# The focused app changed, value is the timestamp
+KIND_FOCUS = b'F'
+# The tracker was (re)started or the machine resumed, the open interval before it
+# is not charged, value is the timestamp
+KIND_START = b'S'
+# Wall clock time in nanoseconds at the timestamp of the preceding start record,
+# only used to place sessions in time
+KIND_WALL = b'W'
+# Everything up to the timestamp in value was persisted
+KIND_CHECKPOINT = b'C'
+# Time tracked before the journal was created, value is the number of nanoseconds
+KIND_BASE = b'B'
+
+JOURNAL_NAME_RE = re.compile(r'TrackedTime\((\d{4}-\d{2}-\d{2})\)\.journal$')
+
+
+class Session(NamedTuple):
+    app: str
+    start: float
+    end: float
+
+
+class JournalReplay(NamedTuple):
+    # Nanoseconds per app
+    totals: dict[str, int]
+    sessions: list[Session]
+    last_timestamp: Optional[float]
+
+
+def journal_path_for(file_path: str) -> str:
+    """
+    Get the path of the journal that belongs to a daily JSON file.
+
+    :param file_path: str
+    :return: str
+    """
+    return os.path.splitext(file_path)[0] + '.journal'
+
+
+def _read_records(f):
+    """
+    Yield (kind, value, app id or name) tuples from a journal file.
+
+    A truncated record at the end of the file, left by a crash, is ignored.
+    """
+    while True:
+        kind = f.read(1)
+        if not kind:
+            return
+        if kind == KIND_NAME:
+            header = kind + f.read(NAME_HEADER.size - 1)
+            if len(header) < NAME_HEADER.size:
+                return
+            _, length = NAME_HEADER.unpack(header)
+            name = f.read(length)
+            if len(name) < length:
+                return
+            yield kind, None, name.decode('utf-8')
+        else:
+            data = kind + f.read(RECORD.size - 1)
+            if len(data) < RECORD.size:
+                return
+            yield RECORD.unpack(data)
+
+
+def replay_journal(journal_path: str) -> JournalReplay:
+    """
+    Rebuild per-app totals and focus sessions from a journal.
+
+    Totals are in nanoseconds, session start and end are wall clock times in seconds.
+
+    :param journal_path: str
+    :return: JournalReplay
+    """
+    names = [None]
+    totals = {}
+    sessions = []
+    current_app, since = None, None
+    last_timestamp = None
+    # Monotonic and wall clock time of the last start, to convert timestamps to wall time
+    anchor = (0, 0)
+
+    def to_wall(timestamp):
+        return (anchor[1] + timestamp - anchor[0]) / utils.NS_PER_SECOND
+
+    def close_interval(timestamp):
+        if current_app is not None and since is not None and timestamp > since:
+            totals[current_app] = totals.get(current_app, 0) + timestamp - since
+            start, end = to_wall(since), to_wall(timestamp)
+            if sessions and sessions[-1].app == current_app and sessions[-1].end == start:
+                sessions[-1] = sessions[-1]._replace(end=end)
+            else:
+                sessions.append(Session(current_app, start, end))
+
+    with open(journal_path, 'rb') as f:
+        for kind, value, app in _read_records(f):
+            if kind == KIND_NAME:
+                names.append(app)
+            elif kind == KIND_BASE:
+                totals[names[app]] = totals.get(names[app], 0) + value
+            elif kind == KIND_START:
+                current_app, since = None, value
+                anchor = (value, anchor[1])
+                last_timestamp = value
+            elif kind == KIND_WALL:
+                anchor = (anchor[0], value)
+            elif kind == KIND_FOCUS:
+                close_interval(value)
+                current_app, since = names[app], value
+                last_timestamp = value
+            elif kind == KIND_CHECKPOINT:
+                close_interval(value)
+                since = value
+                last_timestamp = value
+            else:
+                logger.error(f'Unknown record {kind!r} in journal {journal_path}, stopping replay')
+                break
+    return JournalReplay(totals, sessions, last_timestamp)
+
+
+class FocusJournal:
+    """
+    Append-only journal of focus transitions for one day.
+
+    Each app switch appends one fixed-size record, app names are written once
+    per journal and referenced by id afterwards. Replaying the journal gives
+    back the per-app totals and the focus sessions of the day.
+    """
+
+    def __init__(self, journal_path: str) -> None:
+        self.path = journal_path
+        self._ids = {}
+        if os.path.isfile(journal_path):
+            valid_size = 0
+            with open(journal_path, 'rb') as f:
+                for kind, _, name in _read_records(f):
+                    if kind == KIND_NAME:
+                        self._ids[name] = len(self._ids) + 1
+                    valid_size = f.tell()
+            # Drop a record that was cut off by a crash, so new records stay readable
+            if os.path.getsize(journal_path) > valid_size:
+                logger.warning(f'Truncating incomplete record at the end of journal {journal_path}')
+                os.truncate(journal_path, valid_size)
+        self._file = open(journal_path, 'ab')
+
+    def _app_id(self, app: Optional[str]) -> int:
+        if app is None:
+            return 0
+        app_id = self._ids.get(app)
+        if app_id is None:
+            name = app.encode('utf-8')
+            self._file.write(NAME_HEADER.pack(KIND_NAME, len(name)) + name)
+            app_id = self._ids[app] = len(self._ids) + 1
+        return app_id
+
+    def _append(self, kind: bytes, value: int, app: Optional[str] = None) -> None:
+        self._file.write(RECORD.pack(kind, value, self._app_id(app)))
+        self._file.flush()
+
+    def record_base(self, totals: dict[str, int]) -> None:
+        """
+        Record totals that were tracked before the journal existed.
+
+        :param totals: dict of seconds per app
+        :return: None
+        """
+        for app, seconds in totals.items():
+            self._append(KIND_BASE, seconds * utils.NS_PER_SECOND, app)
+
+    def record_start(self, timestamp_ns: int, wall_time: float) -> None:
+        """
+        Record a tracker start or resume, nothing is charged for the time before it.
+
+        :param timestamp_ns: monotonic timestamp in nanoseconds
+        :param wall_time: wall clock time at timestamp_ns, in seconds
+        :return: None
+        """
+        self._append(KIND_START, timestamp_ns)
+        self._append(KIND_WALL, round(wall_time * utils.NS_PER_SECOND))
+
+    def record_focus(self, app: Optional[str], timestamp_ns: int) -> None:
+        """
+        Record a focus transition to app, None if nothing is charged.
+
+        :param app: str or None
+        :param timestamp_ns: monotonic timestamp in nanoseconds
+        :return: None
+        """
+        self._append(KIND_FOCUS, timestamp_ns, app)
+
+    def checkpoint(self, timestamp_ns: int) -> None:
+        """
+        Record that everything up to timestamp_ns is tracked and sync the journal to disk.
+
+        :param timestamp_ns: monotonic timestamp in nanoseconds
+        :return: None
+        """
+        self._append(KIND_CHECKPOINT, timestamp_ns)
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def compact_journal(journal_path: str, storage, date: datetime.date) -> None:
+    """
+    Replace a finished day's journal with its daily summary.
+
+    The summary contains the per-app totals and the focus sessions of the day.
+
+    :param journal_path: str
+    :param storage: PartitionedStorage or another storage with write_day()
+    :param date: datetime.date
+    :return: None
+    """
+    replay = replay_journal(journal_path)
+    data = build_day_data({app: ns // utils.NS_PER_SECOND for app, ns in replay.totals.items()}, date)
+    data['sessions'] = [[s.app, round(s.start, 3), round(s.end, 3)] for s in replay.sessions]
+    storage.write_day(date, data)
+    os.remove(journal_path)
+    logger.info(f'Compacted journal {journal_path} of {date}')
+
+
+def compact_stale_journals(storage, today: datetime.date = None) -> list[datetime.date]:
+    """
+    Compact the journals of all days before today.
+
+    :param storage: PartitionedStorage or another storage with write_day()
+    :param today: datetime.date, today by default
+    :return: The compacted days
+    """
+    if today is None:
+        today = datetime.date.today()
+    compacted = []
+    for journal_path in glob.glob(os.path.join(storage.root, '*', '*', '*.journal')):
+        match = JOURNAL_NAME_RE.search(journal_path)
+        if match is None:
+            continue
+        date = datetime.date.fromisoformat(match.group(1))
+        if date < today:
+            compact_journal(journal_path, storage, date)
+            compacted.append(date)
+    return compacted
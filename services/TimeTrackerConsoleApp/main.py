@@ -1,10 +1,15 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-
 import logging
 import trackTime
-import requests
-import keyring
+import utils
+from sync import DeltaSync
+from outbox import Outbox, OutboxDrainer
+from idle import WindowsIdleSource
+from sampling import AdaptiveScheduler
+from client import TrackedTimeClient
+from credentials import CredentialStore
+import jwt as pyjwt
 import datetime
+import time
 import json
 from dotenv import load_dotenv
 import os
@@ -13,40 +18,99 @@ import re
 
 load_dotenv()
 DBX_TOKEN = os.getenv('DBX_TOKEN')
+FLUSH_INTERVAL = float(os.getenv('FLUSH_INTERVAL', 60))
+FLUSH_DIRTY_SECONDS = int(os.getenv('FLUSH_DIRTY_SECONDS', 300))
+EXCLUSIONS_FILE = os.getenv('EXCLUSIONS_FILE')
+REFRESH_INTERVAL = float(os.getenv('REFRESH_INTERVAL', 1))
+HEADLESS = os.getenv('HEADLESS', '').lower() in ('1', 'true', 'yes')
+SAMPLE_MIN_INTERVAL = float(os.getenv('SAMPLE_MIN_INTERVAL', 1))
+SAMPLE_MAX_INTERVAL = float(os.getenv('SAMPLE_MAX_INTERVAL', 5))
+IDLE_THRESHOLD = float(os.getenv('IDLE_THRESHOLD', 300))
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+SQLITE_PATH = os.getenv('SQLITE_PATH') or None
+SERVER_URL = os.getenv('SERVER_URL', 'http://127.0.0.1:8000')
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 4))
+TOKEN_REFRESH_LEEWAY = float(os.getenv('TOKEN_REFRESH_LEEWAY', 60))
+SYNC_STATE_FILE = os.getenv('SYNC_STATE_FILE') or os.path.join(trackTime.tracked_time_path, 'sync_state.json')
+OUTBOX_FILE = os.getenv('OUTBOX_FILE') or os.path.join(trackTime.tracked_time_path, 'outbox.json')
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', 1200))
+SYNC_BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', 7))
+SYNC_MAX_BACKOFF = float(os.getenv('SYNC_MAX_BACKOFF', 900))
+
+# One pooled session for every call to the server
+client = TrackedTimeClient(SERVER_URL, timeout=(min(3.05, HTTP_TIMEOUT), HTTP_TIMEOUT), retries=HTTP_RETRIES,
+                           backoff_factor=HTTP_BACKOFF, pool_size=HTTP_POOL_SIZE)
+
+# Tokens are read from keyring once and only written back when they change
+credentials = CredentialStore('time_tracker')
+
+# What the server acknowledged, only the time tracked since is uploaded
+delta_sync = DeltaSync(SYNC_STATE_FILE)
+
+# Days written by the tracker and not uploaded yet
+outbox = Outbox(OUTBOX_FILE)
+
+
+def get_token_expiration(jwt: str) -> float | None:
+    """
+    Read the exp claim of a JWT token locally.
 
+    The signature is not verified, the server does that on every request.
+    The claim only tells when the token has to be refreshed.
 
-def check_token_expiration(jwt: str, jwt_refresh: str) -> tuple[bool, str]:
+    Args:
+        jwt (str): The JWT token
+
+    Returns:
+        float | None: The expiration as a unix timestamp, None if the
+        token can't be decoded or has no exp claim.
     """
-    Check if the given JWT token is valid, if not try to refresh the
-    token and return the new one.
+    try:
+        exp = pyjwt.decode(jwt, options={"verify_signature": False}).get('exp')
+        return float(exp) if exp is not None else None
+    except (pyjwt.InvalidTokenError, TypeError, ValueError):
+        return None
+
+
+def check_token_expiration(jwt: str, jwt_refresh: str, force_refresh: bool = False) -> tuple[bool, str, str]:
+    """
+    Check if the given JWT token is still valid for a while, if not try
+    to refresh the token and return the new one.
+
+    The server rotates refresh tokens, a refresh returns a new refresh token
+    as well and the old one may be blacklisted, so both are returned.
+
+    The expiration is read from the token itself, the server is only called
+    when the token expires within TOKEN_REFRESH_LEEWAY seconds or when
+    force_refresh is set, e.g. after the server answered 401.
 
     Args:
         jwt (str): The JWT token
         jwt_refresh (str): The refresh token
+        force_refresh (bool): Refresh even if the token did not expire yet
 
     Returns:
-        tuple[bool, str]: A tuple containing a boolean indicating if the
-        token is valid and the new token if it is.
+        tuple[bool, str, str]: A tuple containing a boolean indicating if the
+        token is valid, and the token and refresh token to use if it is.
     """
-    payload = {"token": jwt}
-    r = requests.post(
-        "http://127.0.0.1:8000/auth/api/token/verify/", data=payload)
-    if r.status_code == 200:
-        logger.info(f"{r.status_code} JWT Token valid")
-        return (True, jwt)
+    expiration = get_token_expiration(jwt) if jwt else None
+    if not force_refresh and expiration is not None and expiration - time.time() > TOKEN_REFRESH_LEEWAY:
+        logger.debug(f"JWT Token valid for {expiration - time.time():.0f}s")
+        return (True, jwt, jwt_refresh)
     else:
-        logger.error(
-            f"{r.status_code} JWT Token invalid. Trying to refresh jwt")
-        payload = {"refresh": jwt_refresh}
-        r = requests.post(
-            "http://127.0.0.1:8000/auth/api/token/refresh/", data=payload)
+        logger.info("JWT Token expired, expiring or rejected. Trying to refresh jwt")
+        r = client.refresh_token(jwt_refresh)
         if r.status_code == 200:
             logger.info(
                 f"{r.status_code} JWT Refresh Token valid, returning new JWT")
-            return (True, r.json()['access'])
+            tokens = r.json()
+            return (True, tokens['access'], tokens.get('refresh', jwt_refresh))
         else:
             logger.error(f"{r.status_code} JWT Refresh Token invalid")
-            return (False, None)
+            return (False, None, None)
 
 
 def validate_email(email):
@@ -136,9 +200,7 @@ def register():
         "password2": password2,
         "email": email
     }
-    url = 'http://127.0.0.1:8000/auth/api/register/'
-
-    r = requests.post(url, data=payload)
+    r = client.register(payload)
 
     if r.status_code == 201:
         print("Registration successful, please login\n")
@@ -157,21 +219,15 @@ def login():
         while True:
             username = input("Enter your username: ")
             password = input("Enter your password: ")
-            payload = {
-                "username": username,
-                "password": password
-            }
             # Post the credentials to the token endpoint
-            r = requests.post(
-                "http://127.0.0.1:8000/auth/api/token/", data=payload)
+            r = client.obtain_token(username, password)
             if r.status_code == 200:
                 # If the credentials are valid, get the jwt and refresh token
                 jwt = (r.json()).get('access')
                 jwt_refresh = (r.json()).get('refresh')
                 # Save the jwt and refresh token to keyring
-                keyring.set_password('time_tracker', 'jwt', jwt)
-                keyring.set_password(
-                    'time_tracker', 'jwt_refresh', jwt_refresh)
+                credentials.set('jwt', jwt)
+                credentials.set('jwt_refresh', jwt_refresh)
                 logger.info('Added jwt and refresh token to keyring')
                 # Break out of the loop
                 break
@@ -187,27 +243,7 @@ def login():
         sys.exit(0)
 
 
-def get_today_tracked_time_id(jwt):
-    year, month, day = datetime.datetime.now(
-    ).year, datetime.datetime.now().month, datetime.datetime.now().day
-    url = 'http://127.0.0.1:8000/api/trackedtime/'
-    query = {
-        'year': year,
-        'month': month,
-        'day': day
-    }
-    headers = {
-        'Authorization': f'Bearer {jwt}'
-    }
-    r = requests.get(url=url, params=query, headers=headers)
-    if r.json():
-        tracked_time_id = r.json()[0]["id"]
-        return tracked_time_id
-    else:
-        return None
-
-
-def set_jwt_token(jwt, jwt_refresh):
+def set_jwt_token(jwt, jwt_refresh, force_refresh=False):
     """
     Check if jwt is valid, if not prompt user for login and
     save the new jwt and refresh token to keyring.
@@ -215,21 +251,22 @@ def set_jwt_token(jwt, jwt_refresh):
     Args:
         jwt (str): The JWT token
         jwt_refresh (str): The refresh token
+        force_refresh (bool): Refresh the jwt even if it did not expire yet
 
     Returns:
         jwt (str): The JWT token
         jwt_refresh (str): The refresh token
     """
-    is_jwtvalid, jwt = check_token_expiration(jwt, jwt_refresh)
+    is_jwtvalid, jwt, jwt_refresh = check_token_expiration(jwt, jwt_refresh, force_refresh)
     if not is_jwtvalid:
         # If the jwt is invalid, prompt user for login
         login()
     else:
-        # If the jwt is valid, save it to keyring
-        keyring.set_password('time_tracker', 'jwt', jwt)
-    # Get the jwt and refresh token from keyring
-    jwt, jwt_refresh = keyring.get_password(
-        'time_tracker', 'jwt'), keyring.get_password('time_tracker', 'jwt_refresh')
+        # If the jwt is valid, save it and the possibly rotated refresh token to keyring
+        credentials.set('jwt', jwt)
+        credentials.set('jwt_refresh', jwt_refresh)
+    # Get the jwt and refresh token from keyring, served from memory after the first read
+    jwt, jwt_refresh = credentials.get('jwt'), credentials.get('jwt_refresh')
     return jwt, jwt_refresh
 
 
@@ -245,51 +282,126 @@ def authenticate():
         return authenticate()
 
 
+def send_authorized(jwt, jwt_refresh, send):
+    """
+    Send a request with the jwt.
+
+    If the server rejects the jwt, it is refreshed and the request is sent again.
+
+    Returns the jwt in use and the response.
+    """
+    r = send(jwt)
+    if r.status_code == 401:
+        logger.info('JWT Token rejected by the server, refreshing it')
+        jwt = set_jwt_token(jwt, jwt_refresh, force_refresh=True)[0]
+        r = send(jwt)
+    return jwt, r
+
+
+def upload_delta(jwt, jwt_refresh, delta):
+    """
+    Post one delta to the server.
+
+    Returns the jwt in use and True if the server applied the delta now or earlier.
+    """
+    jwt, r = send_authorized(jwt, jwt_refresh, lambda jwt: client.post_delta(jwt, delta))
+    if r.status_code < 300:
+        logger.info(f"Delta {delta['seq']} of {delta['date']} was "
+                    f"{'applied' if r.json().get('applied') else 'already applied'}, status code: {r.status_code}")
+        return jwt, True
+    logger.error(f"Delta {delta['seq']} of {delta['date']} was not applied, status code: {r.status_code}")
+    return jwt, False
+
+
+def upload_merge(jwt, jwt_refresh, days):
+    """
+    Post the whole tracked time of many days through the bulk endpoint, in one request.
+
+    The server keeps the larger time of every app, so a day is never counted twice.
+
+    Returns the jwt in use and the status of every day the server answered for,
+    'created', 'updated', or 'invalid' if it rejected the day for good.
+    """
+    records = [{'date': str(day), 'apps': apps} for day, apps in days.items()]
+    jwt, r = send_authorized(jwt, jwt_refresh, lambda jwt: client.post_days(jwt, records))
+    if r.status_code >= 300:
+        logger.error(f'Tracked time of {len(records)} day(s) was not merged, status code: {r.status_code}')
+        return jwt, {}
+    days = list(days)
+    statuses = {}
+    # The results are in the order of the records, invalid ones have no date
+    for result in r.json():
+        day = days[result['index']]
+        if result['status'] == 'invalid':
+            logger.error(f"Tracked time of {day} was rejected by the server, dropping it: {result['errors']}")
+        else:
+            logger.info(f"Tracked time of {day} was merged, {result['status']}")
+        statuses[day] = result['status']
+    return jwt, statuses
+
+
+def upload_days(days):
+    """
+    Upload the time tracked on days since the last acknowledged upload to the DB.
+
+    Days without acknowledged marks are merged together in one request, the
+    others get a delta each.
+
+    Returns the days the server has all the tracked time of, or rejected for good.
+    """
+    jwt, jwt_refresh = set_jwt_token(credentials.get('jwt'), credentials.get('jwt_refresh'))
+    # Get the time tracking data from the tracker, without touching its files
+    apps = {day: trackTime.get_tracked_apps(day) for day in days}
+    totals = {day: {app: utils.time_to_seconds(apptime) for app, apptime in apps[day].items()} for day in days}
+    uploaded = set()
+    unmarked = [day for day in days if not delta_sync.has_marks(day)]
+    if unmarked:
+        # The server may already have these days, e.g. on the first upload after an upgrade or once the
+        # sync state was lost. Deltas of the full totals would count them twice, merging never does.
+        jwt, statuses = upload_merge(jwt, jwt_refresh, {day: apps[day] for day in unmarked})
+        for day, merge_status in statuses.items():
+            if merge_status != 'invalid':
+                delta_sync.seed(day, totals[day])
+            uploaded.add(day)
+    for day in days:
+        # Days whose merge failed or was rejected have no marks to build deltas on
+        if not delta_sync.has_marks(day):
+            continue
+        while (delta := delta_sync.next_delta(day, totals[day])) is not None:
+            jwt, sent = upload_delta(jwt, jwt_refresh, delta)
+            if not sent:
+                return uploaded
+            # The marks of days still waiting for an upload are needed, however old they are
+            delta_sync.acknowledge(delta, keep=[pending_day for pending_day, _ in outbox.pending()])
+        uploaded.add(day)
+    return uploaded
+
+
 def upload_to_db():
     """
     This function is used as a close handler for the time tracker.
-    It uploads the current time tracking data to the DB
+    It uploads every day in the outbox, oldest first, until the outbox is
+    empty or the server can't be reached.
     """
     try:
-        # Get the file path and name of the current time tracking data
-        file_path = trackTime.get_file_path()
-        apps = trackTime.get_time_tracker_data(file_path)
-        jwt = keyring.get_password('time_tracker', 'jwt')
-        jwt_refresh = keyring.get_password('time_tracker', 'jwt_refresh')
-        jwt = set_jwt_token(jwt, jwt_refresh)[0]
-
-        tracked_time_id = get_today_tracked_time_id(jwt)
-        if tracked_time_id is None:
-            logger.info(
-                'No tracked time found for today, creating new tracked time')
-            url = 'http://127.0.0.1:8000/api/trackedtime/'
-            headers = {
-                'Authorization': f'Bearer {jwt}'
-            }
-            r = requests.post(url=url, headers=headers, json={'apps': apps})
-            if r.status_code < 300:
-                logger.info(
-                    'Tracked Time was created, status code: ' + str(r.status_code))
-            else:
-                logger.error(
-                    'Tracked Time was not created, status code: ' + str(r.status_code))
-        else:
-            url = f'http://127.0.0.1:8000/api/trackedtime/{tracked_time_id}/'
-            headers = {
-                'Authorization': f'Bearer {jwt}'
-            }
-            r = requests.patch(url=url, headers=headers, json=apps)
-            logger.info(
-                'Tracked Time was updated, status code: ' + str(r.status_code))
+        while drainer.drain():
+            pass
     except Exception as e:
         logger.error(e)
         print(e)
 
 
+# Pushes the outbox to the server with backoff while it is unreachable
+drainer = OutboxDrainer(outbox, upload_days, interval=SYNC_INTERVAL, batch_size=SYNC_BATCH_SIZE,
+                        max_delay=SYNC_MAX_BACKOFF)
+
+
 def main():
     try:
         logger.info('Tracker started')
-        jwt_refresh = keyring.get_password('time_tracker', 'jwt_refresh')
+        if STORAGE_BACKEND == 'sqlite':
+            trackTime.use_sqlite_storage(SQLITE_PATH)
+        jwt_refresh = credentials.get('jwt_refresh')
         if jwt_refresh is None:
             authenticate()
         else:
@@ -297,17 +409,28 @@ def main():
                 'If you want to logout type 1, otherwise press any key: ')
             if choice.replace(' ', '').strip() == '1':
                 authenticate()
-        scheduler = BackgroundScheduler()  # Create a background scheduler
-
-        # Add a job to the scheduler to run the close handler every hour
-        scheduler.add_job(upload_to_db, 'interval', minutes=20)
-        scheduler.start()  # Start the scheduler
-
-        trackTime.time_tracker()  # Start the time tracker
+        # Upload the outbox in the background, right away and then every SYNC_INTERVAL seconds
+        drainer.start()
+
+        # Sample the foreground window adaptively and pause tracking while the user is away
+        sampling_scheduler = AdaptiveScheduler(WindowsIdleSource(),
+                                               min_interval=SAMPLE_MIN_INTERVAL,
+                                               max_interval=SAMPLE_MAX_INTERVAL,
+                                               idle_threshold=IDLE_THRESHOLD)
+
+        # Start the time tracker
+        trackTime.time_tracker(flush_interval=FLUSH_INTERVAL,
+                               flush_dirty_seconds=FLUSH_DIRTY_SECONDS,
+                               exclusions_path=EXCLUSIONS_FILE,
+                               refresh_interval=REFRESH_INTERVAL,
+                               headless=HEADLESS,
+                               scheduler=sampling_scheduler,
+                               outbox=outbox)
 
     except KeyboardInterrupt:  # Catch the KeyboardInterrupt exception when the user stops the script
-        upload_to_db()  # Call the close handler to upload the file to Dropbox
         print("Exiting program, sending data to db...")
+        drainer.stop()
+        upload_to_db()  # Call the close handler to upload the outbox to the db
     except Exception as e:
         logger.error(e)
         print(e)
@@ -0,0 +1,176 @@
+import os
+import json
+import random
+import datetime
+import logging
+import threading
+from typing import Callable, Optional
+
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    Durable set of days whose tracked time changed and was not uploaded yet.
+
+    Days are marked by the writer whenever their totals reach the storage and
+    removed by the uploader once the server has them. The set survives restarts
+    in a small JSON file, which is only rewritten when a day is added or
+    removed. Every mark bumps an in-memory generation, a day that was marked
+    again while it was being uploaded stays in the outbox.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._generations = {}
+        try:
+            with open(path, 'r') as f:
+                days = json.load(f)['days']
+            self._generations = {datetime.date.fromisoformat(day): 0 for day in days}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f'Failed to read the outbox from {path}, starting empty: {str(e)}')
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        atomic_write_json(self.path, {'days': sorted(str(day) for day in self._generations)})
+
+    def mark(self, day: datetime.date) -> None:
+        """
+        Record that the totals of a day changed.
+
+        :param day: datetime.date
+        :return: None
+        """
+        with self._lock:
+            is_new = day not in self._generations
+            self._generations[day] = self._generations.get(day, 0) + 1
+            if is_new:
+                self._save()
+
+    def pending(self) -> list[tuple[datetime.date, int]]:
+        """
+        Get the days waiting for an upload, oldest first.
+
+        :return: list of (day, generation)
+        """
+        with self._lock:
+            return sorted(self._generations.items())
+
+    def done(self, day: datetime.date, generation: int) -> bool:
+        """
+        Remove a day after its upload, unless it was marked again in the meantime.
+
+        :param day: datetime.date
+        :param generation: int, as returned by pending()
+        :return: True if the day was removed
+        """
+        with self._lock:
+            if self._generations.get(day) != generation:
+                return False
+            del self._generations[day]
+            self._save()
+            return True
+
+    def stats(self) -> dict:
+        """
+        Get the number of pending days and the oldest of them.
+
+        :return: dict
+        """
+        with self._lock:
+            return {'depth': len(self._generations),
+                    'oldest': str(min(self._generations)) if self._generations else None}
+
+
+class OutboxDrainer(threading.Thread):
+    """
+    Background uploader that empties the outbox, oldest day first.
+
+    Every interval seconds, or when woken up, up to batch_size days are passed
+    to upload in one call, which returns the days the server has now, so it can
+    send the whole batch in as few requests as it likes. Further batches follow
+    right away while days are left. When an upload fails the drainer
+    retries after an exponential backoff starting at base_delay and capped at
+    max_delay, with random jitter so many clients coming back online don't
+    retry in lockstep.
+    """
+
+    def __init__(self, outbox: Outbox, upload: Callable[[list[datetime.date]], set[datetime.date]], interval: float = 1200,
+                 batch_size: int = 7, base_delay: float = 5, max_delay: float = 900) -> None:
+        super().__init__(name='outbox', daemon=True)
+        self.outbox = outbox
+        self.upload = upload
+        self.interval = interval
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        # Uploads of the drainer thread and of drain() called on other threads never overlap
+        self._drain_lock = threading.Lock()
+
+    def backoff(self) -> float:
+        """
+        Get the delay before the next attempt after self.failures failures in a row.
+
+        :return: float, seconds
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    def drain(self) -> Optional[bool]:
+        """
+        Upload one batch of pending days.
+
+        :return: True if days are left, False if the outbox is empty, None if an upload failed
+        """
+        with self._drain_lock:
+            pending = self.outbox.pending()
+            batch = pending[:self.batch_size]
+            uploaded = set()
+            if batch:
+                try:
+                    uploaded = self.upload([day for day, _ in batch])
+                except Exception as e:
+                    logger.error(f'Failed to upload {batch[0][0]} to {batch[-1][0]}: {str(e)}')
+            # A day marked again during the upload keeps its place in the outbox
+            for day, generation in batch:
+                if day in uploaded:
+                    self.outbox.done(day, generation)
+            if any(day not in uploaded for day, _ in batch):
+                self.failures += 1
+                logger.info(f'Outbox upload failed {self.failures} time(s) in a row, {self.outbox.stats()}')
+                return None
+            self.failures = 0
+            logger.info(f'Outbox drained, {self.outbox.stats()}')
+            return len(pending) > self.batch_size
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            more = self.drain()
+            if more is None:
+                timeout = self.backoff()
+            elif more:
+                continue
+            else:
+                timeout = self.interval
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def wake(self) -> None:
+        """
+        Drain now instead of waiting for the interval or the backoff.
+
+        :return: None
+        """
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake.set()
@@ -0,0 +1,263 @@
+import queue
+import datetime
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+import utils
+from accumulator import Leaderboard
+from exclusions import ExclusionRules
+from renderer import ConsoleRenderer
+from sampling import AdaptiveScheduler
+from journal import FocusJournal, compact_journal, journal_path_for
+from outbox import Outbox
+from storage import PartitionedStorage, build_day_data
+from window_source import WindowSource
+
+logger = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    """
+    The app to charge, sampled at timestamp_ns.
+
+    timestamp_ns is a monotonic timestamp in nanoseconds, wall_time is the
+    wall clock time of the same moment and only decides which day the sample
+    belongs to. changed is True when the charged app is different from the
+    previous sample. resumed is True when the machine was suspended since the
+    previous sample, the time in between must not be charged. Samples that
+    neither changed nor resumed anything only move the charged time forward
+    and may be dropped when the consumer falls behind.
+    """
+    app: Optional[str]
+    timestamp_ns: int
+    wall_time: float
+    changed: bool
+    resumed: bool = False
+
+
+class SamplerThread(threading.Thread):
+    """
+    Producer that samples the foreground window and pushes Samples onto a bounded queue.
+
+    The sampler only records timestamps, it never touches the disk or the
+    console, so slow consumers can't skew the measured durations. When the
+    queue is full, samples without a change are dropped and counted, changes
+    wait for room (backpressure) since their timestamps are already taken.
+    A None item marks the end of the stream.
+
+    A wait that takes more than suspend_tolerance seconds longer than asked
+    means the machine was suspended, the sampler then reports a resume.
+
+    Time after the last input is only charged once the user is known to be
+    active again, samples without a change are stamped at the last input. A
+    user going idle stops being charged at the last input, not idle_threshold
+    seconds later when the idle period is detected.
+    """
+
+    def __init__(self, source: WindowSource, scheduler: AdaptiveScheduler, exclusions: ExclusionRules,
+                 maxsize: int = 256, suspend_tolerance: float = 15) -> None:
+        super().__init__(name='sampler', daemon=True)
+        self.source = source
+        self.scheduler = scheduler
+        self.exclusions = exclusions
+        self.queue = queue.Queue(maxsize)
+        self.stop_event = threading.Event()
+        self.suspend_tolerance_ns = round(suspend_tolerance * utils.NS_PER_SECOND)
+        self.dropped = 0
+        self.blocked = 0
+        self.suspends = 0
+
+    def _put(self, sample: Optional[Sample]) -> None:
+        try:
+            self.queue.put_nowait(sample)
+            return
+        except queue.Full:
+            self.blocked += 1
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(sample, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _offer(self, sample: Sample) -> None:
+        try:
+            self.queue.put_nowait(sample)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self) -> None:
+        # The focused app after exclusions, charged unless the user is idle
+        focused_app = None
+        charged_app = None
+        # Timestamp of the latest sample, samples never go back in time
+        last_ns = self.source.monotonic_ns()
+        try:
+            while not self.stop_event.is_set() and not self.source.closed:
+                try:
+                    # Wait for the next focus change, the interval grows while the focus is stable
+                    timeout = self.scheduler.interval
+                    before = self.source.monotonic_ns()
+                    event = self.source.next_event(timeout=timeout)
+                    now = self.source.monotonic_ns()
+                    wall_time = self.source.now()
+
+                    if now - before > round(timeout * utils.NS_PER_SECOND) + self.suspend_tolerance_ns:
+                        # The machine was asleep, skip the gap for the app that was charged before it
+                        self.suspends += 1
+                        logger.info(f'Suspend of {(now - before) / utils.NS_PER_SECOND:.0f}s detected, not tracked')
+                        self._put(Sample(charged_app, now, wall_time, False, True))
+                        last_ns = now
+
+                    if event is not None:
+                        # Excluded and unresolved apps are not charged until the focus moves on
+                        focused_app = event.app if event.app and not self.exclusions.is_excluded(event.app) else None
+
+                    # Nothing is charged while the user is away from the keyboard
+                    self.scheduler.check_idle()
+                    app = None if self.scheduler.idle else focused_app
+                    # The user was last seen active at the last input
+                    timestamp = max(last_ns, now - round(self.scheduler.idle_seconds * utils.NS_PER_SECOND))
+                    if app != charged_app and event is not None and not self.scheduler.idle:
+                        timestamp = max(last_ns, event.timestamp_ns)
+                    sample = Sample(app, timestamp, wall_time - (now - timestamp) / utils.NS_PER_SECOND,
+                                    app != charged_app)
+                    last_ns = timestamp
+                    if sample.changed:
+                        charged_app = app
+                        self._put(sample)
+                    else:
+                        self._offer(sample)
+                    self.scheduler.on_sample(event is not None)
+
+                except Exception as e:
+                    logger.exception(f'Failed to sample the foreground window: {str(e)}')
+            # Close the last interval where the sampler stopped
+            self._put(Sample(None, self.source.monotonic_ns(), self.source.now(), True))
+        finally:
+            self._put(None)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get queue counters of the sampler.
+
+        :return: dict
+        """
+        return {'queued': self.queue.qsize(), 'dropped': self.dropped, 'blocked': self.blocked,
+                'suspends': self.suspends}
+
+
+class PersistenceThread(threading.Thread):
+    """
+    Consumer that writes journal records and daily file flushes in the order they were queued.
+
+    Every item names the day it belongs to, the partition and the journal are
+    resolved per item, so a day rollover only opens the next journal.
+    Producers block once maxsize writes are pending, so memory stays bounded
+    when the disk is slow. Days written to the storage are marked in the
+    outbox, if any, so they get uploaded.
+    """
+
+    def __init__(self, storage: PartitionedStorage, maxsize: int = 1024, outbox: Optional[Outbox] = None) -> None:
+        super().__init__(name='persistence', daemon=True)
+        self.storage = storage
+        self.outbox = outbox
+        self.queue = queue.Queue(maxsize)
+        self.written = 0
+        self._day = None
+        self._journal = None
+
+    def record_base(self, day: datetime.date, totals: dict[str, int]) -> None:
+        self.queue.put(('base', day, totals, None))
+
+    def record_start(self, day: datetime.date, timestamp_ns: int, wall_time: float) -> None:
+        self.queue.put(('start', day, wall_time, timestamp_ns))
+
+    def record_focus(self, day: datetime.date, app: Optional[str], timestamp_ns: int) -> None:
+        self.queue.put(('focus', day, app, timestamp_ns))
+
+    def flush(self, day: datetime.date, totals: dict[str, int], since: int) -> None:
+        self.queue.put(('flush', day, totals, since))
+
+    def finish_day(self, day: datetime.date) -> None:
+        self.queue.put(('finish', day, None, None))
+
+    def stop(self) -> None:
+        self.queue.put(None)
+
+    def _journal_for(self, day: datetime.date) -> FocusJournal:
+        if day != self._day:
+            self._close_journal()
+            self.storage.ensure_partition(day)
+            self._journal = FocusJournal(journal_path_for(self.storage.file_path(day)))
+            self._day = day
+        return self._journal
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal, self._day = None, None
+
+    def _write(self, kind: str, day: datetime.date, value, timestamp: Optional[int]) -> None:
+        if kind == 'base':
+            self._journal_for(day).record_base(value)
+        elif kind == 'start':
+            self._journal_for(day).record_start(timestamp, value)
+        elif kind == 'focus':
+            self._journal_for(day).record_focus(value, timestamp)
+        elif kind == 'flush':
+            self.storage.write_day(day, build_day_data(value, day))
+            if self.outbox is not None:
+                self.outbox.mark(day)
+            if timestamp is not None:
+                self._journal_for(day).checkpoint(timestamp)
+            logger.debug(f'Flushed tracked time of {day}')
+        elif kind == 'finish':
+            # The day is over, replace its journal with the daily summary
+            if day == self._day:
+                self._close_journal()
+            compact_journal(journal_path_for(self.storage.file_path(day)), self.storage, day)
+            if self.outbox is not None:
+                self.outbox.mark(day)
+
+    def run(self) -> None:
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                try:
+                    self._write(*item)
+                    self.written += 1
+                except Exception as e:
+                    logger.exception(f'Failed to persist tracked time: {str(e)}')
+        finally:
+            self._close_journal()
+
+
+class RendererThread(threading.Thread):
+    """
+    Consumer that redraws the table from the leaderboard every refresh interval.
+    """
+
+    def __init__(self, renderer: ConsoleRenderer, leaderboard: Leaderboard) -> None:
+        super().__init__(name='renderer', daemon=True)
+        self.renderer = renderer
+        # Replaced by the aggregator when a new day starts
+        self.leaderboard = leaderboard
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.renderer.render(self.leaderboard.top(self.renderer.row_count()))
+            except Exception as e:
+                logger.exception(f'Failed to render tracked time: {str(e)}')
+            self.stop_event.wait(self.renderer.refresh_interval)
+
+    def stop(self) -> None:
+        self.stop_event.set()
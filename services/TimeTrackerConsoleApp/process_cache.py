@@ -0,0 +1,70 @@
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1024)
+def normalize_process_name(name: str) -> str:
+    """
+    Convert a raw process name into the name shown to the user.
+
+    'chrome.exe' -> 'Chrome'
+
+    :param name: str
+    :return: str
+    """
+    return name.replace('.exe', '').capitalize()
+
+
+class ProcessNameCache:
+    """
+    Bounded LRU cache of display names of running processes.
+
+    Entries are keyed by (pid, create_time), so a reused pid belongs to a new
+    entry and the name of a process is resolved once per process lifetime.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._names = OrderedDict()
+
+    def get(self, pid: int) -> Optional[str]:
+        """
+        Get the display name of the process with the given pid.
+
+        :param pid: int
+        :return: The display name, or None if the process can't be accessed.
+        """
+        try:
+            # psutil reads the create time to identify the process anyway
+            process = psutil.Process(pid)
+            key = (pid, process.create_time())
+            name = self._names.get(key)
+            if name is not None:
+                self._names.move_to_end(key)
+                self.hits += 1
+                return name
+            self.misses += 1
+            name = normalize_process_name(process.name())
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            # If the process doesn't exist, or we don't have access to it, or it's a zombie process, skip it
+            return None
+        self._names[key] = name
+        if len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+        return name
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get hit and miss counters of the cache.
+
+        :return: dict
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._names)}
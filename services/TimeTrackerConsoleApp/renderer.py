@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import logging
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+CLEAR_SCREEN = '\x1b[2J\x1b[H'
+CLEAR_LINE = '\x1b[K'
+
+
+def move_to(row: int) -> str:
+    """
+    ANSI sequence that moves the cursor to the beginning of a row, rows start at 1.
+
+    :param row: int
+    :return: str
+    """
+    return f'\x1b[{row};1H'
+
+
+class ConsoleRenderer:
+    """
+    Draw the tracked time table in place.
+
+    Instead of clearing the console, only the rows that changed since the last
+    frame are rewritten using ANSI cursor movement. RendererThread draws a
+    frame every refresh_interval seconds. The table is cut to max_rows rows,
+    by default to the rows that fit below the title in the terminal. A
+    headless renderer draws nothing.
+    """
+
+    def __init__(self, refresh_interval: float = 1, max_rows: int = None, headless: bool = False,
+                 stream=None) -> None:
+        self.refresh_interval = refresh_interval
+        self.max_rows = max_rows
+        self.headless = headless
+        self.stream = stream or sys.stdout
+        self._lines = []
+
+    def start(self, title: str) -> None:
+        """
+        Clear the console once and print the title on the first row.
+
+        :param title: str
+        :return: None
+        """
+        if self.headless:
+            return
+        if os.name == 'nt':
+            # Let the Windows console interpret ANSI sequences
+            import colorama
+            colorama.just_fix_windows_console()
+        self.stream.write(CLEAR_SCREEN + title + '\n')
+        self.stream.flush()
+        self._lines = []
+
+    @staticmethod
+    def format_row(app: str, seconds: int) -> str:
+        return '| %s: %-35s |' % (utils.seconds_to_time(seconds), app)
+
+    def row_count(self) -> int:
+        """
+        Get the number of rows a frame can show.
+
+        :return: int
+        """
+        if self.max_rows is not None:
+            return self.max_rows
+        # The title takes the first line and the cursor rests on the line after the table
+        return max(0, shutil.get_terminal_size().lines - 2)
+
+    def render(self, rows: list[tuple[str, int]]) -> bool:
+        """
+        Draw the table.
+
+        :param rows: list of (app, seconds) pairs in display order
+        :return: True if a frame was drawn
+        """
+        if self.headless:
+            return False
+        rows = rows[:self.row_count()]
+        lines = [self.format_row(app, seconds) for app, seconds in rows]
+        output = []
+        for i, line in enumerate(lines):
+            if i >= len(self._lines) or self._lines[i] != line:
+                # The title takes the first row
+                output.append(move_to(i + 2) + line + CLEAR_LINE)
+        for i in range(len(lines), len(self._lines)):
+            output.append(move_to(i + 2) + CLEAR_LINE)
+        if output:
+            output.append(move_to(len(lines) + 2))
+            self.stream.write(''.join(output))
+            self.stream.flush()
+        self._lines = lines
+        return True
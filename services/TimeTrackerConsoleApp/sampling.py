@@ -0,0 +1,57 @@
+import logging
+
+from idle import IdleSource, NeverIdleSource
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveScheduler:
+    """
+    Decide how long the tracker waits between two samples of the foreground window.
+
+    The interval starts at min_interval and grows by backoff after every sample
+    without a focus change, up to max_interval. A focus change or returning
+    from idle resets it to min_interval. The user counts as idle once there was
+    no input for idle_threshold seconds, while idle nothing is charged and the
+    input source is checked every min_interval seconds so the tracker resumes
+    as soon as there is activity again. idle_seconds keeps the time without
+    input seen by the last check, the idle period started that long ago.
+    """
+
+    def __init__(self, idle_source: IdleSource = None, min_interval: float = 1, max_interval: float = 5,
+                 backoff: float = 1.5, idle_threshold: float = 300) -> None:
+        self.idle_source = idle_source or NeverIdleSource()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.idle_threshold = idle_threshold
+        self.interval = min_interval
+        self.idle = False
+        self.idle_seconds = 0.0
+
+    def on_sample(self, focus_changed: bool) -> None:
+        """
+        Adjust the interval after a sample.
+
+        :param focus_changed: bool
+        :return: None
+        """
+        if focus_changed or self.idle:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def check_idle(self) -> bool:
+        """
+        Update the idle state from the input source.
+
+        :return: True if the idle state changed
+        """
+        self.idle_seconds = self.idle_source.idle_seconds()
+        idle = self.idle_seconds >= self.idle_threshold
+        if idle == self.idle:
+            return False
+        self.idle = idle
+        self.interval = self.min_interval
+        logger.info('User is idle, tracking suspended' if idle else 'User is active, tracking resumed')
+        return True
@@ -0,0 +1,169 @@
+import os
+import sys
+import glob
+import json
+import sqlite3
+import datetime
+import logging
+import threading
+
+import utils
+from storage import PartitionedStorage, DAY_FILE_NAME_RE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS app_time (
+    day TEXT NOT NULL,
+    app TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (day, app)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS session (
+    day TEXT NOT NULL,
+    app TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_day ON session (day, start);
+'''
+
+
+class SQLiteStorage(PartitionedStorage):
+    """
+    Daily totals stored in a local SQLite database instead of JSON files.
+
+    The database holds one (day, app, seconds) row per app and day plus the
+    focus sessions of compacted days. It runs in WAL mode so readers, like the
+    uploader, never block the tracker, and every write_day() is one batched
+    transaction. Journals still live in the partition directories of the root.
+    """
+
+    def __init__(self, root: str, db_path: str = None) -> None:
+        super().__init__(root)
+        self.db_path = db_path or os.path.join(root, 'tracked_time.db')
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, every thread gets its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def write_day(self, date: datetime.date, data: dict) -> str:
+        """
+        Replace the rows of the date with the content of a daily file.
+
+        :param date: datetime.date
+        :param data: dict, the content of a daily file, 'sessions' is optional
+        :return: The path of the database
+        """
+        day = str(date)
+        rows = [(day, app, utils.time_to_seconds(apptime)) for app, apptime in data['apps'].items()]
+        with self._connection() as connection:
+            connection.execute('DELETE FROM app_time WHERE day = ?', (day,))
+            connection.executemany('INSERT INTO app_time (day, app, seconds) VALUES (?, ?, ?)', rows)
+            if 'sessions' in data:
+                connection.execute('DELETE FROM session WHERE day = ?', (day,))
+                connection.executemany('INSERT INTO session (day, app, start, end) VALUES (?, ?, ?, ?)',
+                                       [(day, app, start, end) for app, start, end in data['sessions']])
+        return self.db_path
+
+    def read_day(self, date: datetime.date) -> dict[str, str]:
+        rows = self._connection().execute(
+            'SELECT app, seconds FROM app_time WHERE day = ? ORDER BY seconds DESC', (str(date),))
+        return {app: utils.seconds_to_time(seconds) for app, seconds in rows}
+
+    def days_between(self, start: datetime.date, end: datetime.date) -> list[tuple[datetime.date, str]]:
+        """
+        Get the tracked days between start and end, both included, from the database.
+
+        :param start: datetime.date
+        :param end: datetime.date
+        :return: list of (date, database path) pairs sorted by date
+        """
+        rows = self._connection().execute(
+            'SELECT DISTINCT day FROM app_time WHERE day BETWEEN ? AND ? ORDER BY day', (str(start), str(end)))
+        return [(datetime.date.fromisoformat(day), self.db_path) for day, in rows]
+
+    def read_range(self, start: datetime.date, end: datetime.date) -> dict[datetime.date, dict]:
+        days = {}
+        rows = self._connection().execute(
+            'SELECT day, app, seconds FROM app_time WHERE day BETWEEN ? AND ? ORDER BY day, seconds DESC',
+            (str(start), str(end)))
+        for day, app, seconds in rows:
+            days.setdefault(datetime.date.fromisoformat(day), {})[app] = utils.seconds_to_time(seconds)
+        return days
+
+    def totals_between(self, start: datetime.date, end: datetime.date) -> dict[str, int]:
+        """
+        Sum the tracked seconds of every app between start and end, both included.
+
+        :param start: datetime.date
+        :param end: datetime.date
+        :return: dict {app: seconds} sorted by the most time tracked
+        """
+        rows = self._connection().execute(
+            'SELECT app, SUM(seconds) AS total FROM app_time WHERE day BETWEEN ? AND ? '
+            'GROUP BY app ORDER BY total DESC', (str(start), str(end)))
+        return dict(rows)
+
+    def sessions(self, date: datetime.date) -> list[tuple[str, float, float]]:
+        """
+        Get the focus sessions of a compacted day.
+
+        :param date: datetime.date
+        :return: list of (app, start, end) with wall clock times in seconds
+        """
+        rows = self._connection().execute(
+            'SELECT app, start, end FROM session WHERE day = ? ORDER BY start', (str(date),))
+        return rows.fetchall()
+
+    def is_empty(self) -> bool:
+        return self._connection().execute('SELECT 1 FROM app_time LIMIT 1').fetchone() is None
+
+    def import_json_tree(self, tracked_time_path: str = None) -> int:
+        """
+        Import every daily JSON file of a TrackedTime directory in one transaction.
+
+        Days that are already in the database are replaced.
+
+        :param tracked_time_path: str, the root of this storage by default
+        :return: The number of imported days
+        """
+        tracked_time_path = tracked_time_path or self.root
+        app_rows, session_rows, days = [], [], []
+        for file_path in glob.glob(os.path.join(tracked_time_path, '*', '*', 'TrackedTime(*).json')):
+            match = DAY_FILE_NAME_RE.search(file_path)
+            if match is None:
+                continue
+            try:
+                with open(file_path, 'r') as f:
+                    data = json.load(f)
+                day = match.group(1)
+                app_rows += [(day, app, utils.time_to_seconds(apptime)) for app, apptime in data['apps'].items()]
+                session_rows += [(day, app, start, end) for app, start, end in data.get('sessions', [])]
+                days.append((day,))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f'Skipping {file_path}: {str(e)}')
+        with self._connection() as connection:
+            connection.executemany('DELETE FROM app_time WHERE day = ?', days)
+            connection.executemany('DELETE FROM session WHERE day = ?', days)
+            connection.executemany('INSERT INTO app_time (day, app, seconds) VALUES (?, ?, ?)', app_rows)
+            connection.executemany('INSERT INTO session (day, app, start, end) VALUES (?, ?, ?, ?)', session_rows)
+        logger.info(f'Imported {len(days)} days from {tracked_time_path} into {self.db_path}')
+        return len(days)
+
+
+if __name__ == '__main__':
+    # python sqlite_storage.py [TrackedTime directory] [database path]
+    tracked_time_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(utils.BASE_PATH, 'TrackedTime')
+    db_path = sys.argv[2] if len(sys.argv) > 2 else None
+    print(f'Imported {SQLiteStorage(tracked_time_path, db_path).import_json_tree()} days')
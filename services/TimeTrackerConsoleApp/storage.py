@@ -0,0 +1,245 @@
+import os
+import re
+import glob
+import json
+import time
+import datetime
+import logging
+import tempfile
+
+import utils
+from accumulator import TimeAccumulator
+
+logger = logging.getLogger(__name__)
+
+DAY_FILE_NAME_RE = re.compile(r'TrackedTime\((\d{4}-\d{2}-\d{2})\)\.json$')
+
+
+def atomic_write_json(file_path: str, data: dict) -> None:
+    """
+    Write data to a JSON file without ever leaving a truncated file behind.
+
+    The data is written to a temporary file in the same directory, fsynced and
+    renamed over the target, so readers see either the old or the new content.
+
+    :param file_path: str
+    :param data: dict
+    :return: None
+    """
+    dir_path = os.path.dirname(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def build_day_data(totals: dict[str, int], date: datetime.date = None) -> dict:
+    """
+    Build the content of a daily file from per-app totals in seconds.
+
+    Apps are sorted by the most time tracked.
+
+    :param totals: dict
+    :param date: datetime.date, today by default
+    :return: dict
+    """
+    if date is None:
+        date = datetime.date.today()
+    apps = sorted(totals.items(), key=lambda x: x[1], reverse=True)
+    return {
+        'year': date.year,
+        'month': date.month,
+        'day': date.day,
+        'apps': {app: utils.seconds_to_time(seconds) for app, seconds in apps}
+    }
+
+
+class PartitionedStorage:
+    """
+    Daily files partitioned by year and month under a root directory.
+
+    {root}/{year}/{Month}-{year}/TrackedTime({date}).json
+
+    Partitions are resolved from the date of every write, so a tracker running
+    past midnight or into a new month writes to the right file without a
+    restart. The directory of the next day is created ahead of time. An index
+    file maps dates to their daily files, so date ranges can be read without
+    walking the directories.
+    """
+
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.index_path = os.path.join(root, self.INDEX_NAME)
+        self._created_dirs = set()
+        self._index = None
+
+    def partition_dir(self, date: datetime.date) -> str:
+        """
+        Get the directory of the month the date belongs to.
+
+        :param date: datetime.date
+        :return: str
+        """
+        return os.path.join(self.root, str(date.year), date.strftime('%B') + '-' + str(date.year))
+
+    def file_path(self, date: datetime.date) -> str:
+        """
+        Get the path of the daily file of the date.
+
+        :param date: datetime.date
+        :return: str
+        """
+        return os.path.join(self.partition_dir(date), f'TrackedTime({date}).json')
+
+    def ensure_partition(self, date: datetime.date) -> None:
+        """
+        Create the directory of the date and of the next day if they do not exist yet.
+
+        :param date: datetime.date
+        :return: None
+        """
+        for day in (date, date + datetime.timedelta(days=1)):
+            dir_path = self.partition_dir(day)
+            if dir_path not in self._created_dirs:
+                os.makedirs(dir_path, exist_ok=True)
+                self._created_dirs.add(dir_path)
+
+    def _load_index(self) -> dict[str, str]:
+        if self._index is None:
+            try:
+                with open(self.index_path, 'r') as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.rebuild_index()
+        return self._index
+
+    def rebuild_index(self) -> None:
+        """
+        Build the index by walking the partitions once.
+
+        :return: None
+        """
+        index = {}
+        for file_path in glob.glob(os.path.join(self.root, '*', '*', 'TrackedTime(*).json')):
+            match = DAY_FILE_NAME_RE.search(file_path)
+            if match is not None:
+                index[match.group(1)] = os.path.relpath(file_path, self.root)
+        self._index = dict(sorted(index.items()))
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write_json(self.index_path, self._index)
+
+    def _add_to_index(self, date: datetime.date, file_path: str) -> None:
+        index = self._load_index()
+        if str(date) not in index:
+            index[str(date)] = os.path.relpath(file_path, self.root)
+            atomic_write_json(self.index_path, index)
+
+    def write_day(self, date: datetime.date, data: dict) -> str:
+        """
+        Atomically write the daily file of the date.
+
+        :param date: datetime.date
+        :param data: dict, the content of the daily file
+        :return: The path of the written file
+        """
+        self.ensure_partition(date)
+        file_path = self.file_path(date)
+        atomic_write_json(file_path, data)
+        self._add_to_index(date, file_path)
+        return file_path
+
+    def read_day(self, date: datetime.date) -> dict[str, str]:
+        """
+        Read the apps of a day without modifying anything.
+
+        :param date: datetime.date
+        :return: dict {app: 'hh:mm:ss'}, empty if the day was not tracked or the file is unreadable
+        """
+        file_path = self.file_path(date)
+        try:
+            with open(file_path, 'r') as f:
+                return json.load(f)['apps']
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f'Failed to read {file_path}: {str(e)}')
+            return {}
+
+    def days_between(self, start: datetime.date, end: datetime.date) -> list[tuple[datetime.date, str]]:
+        """
+        Get the daily files between start and end, both included, from the index.
+
+        :param start: datetime.date
+        :param end: datetime.date
+        :return: list of (date, file path) pairs sorted by date
+        """
+        return [(datetime.date.fromisoformat(day), os.path.join(self.root, path))
+                for day, path in sorted(self._load_index().items())
+                if str(start) <= day <= str(end)]
+
+    def read_range(self, start: datetime.date, end: datetime.date) -> dict[datetime.date, dict]:
+        """
+        Read the apps of every tracked day between start and end, both included.
+
+        :param start: datetime.date
+        :param end: datetime.date
+        :return: dict mapping dates to their {app: 'hh:mm:ss'} data
+        """
+        days = {}
+        for date, file_path in self.days_between(start, end):
+            try:
+                with open(file_path, 'r') as f:
+                    days[date] = json.load(f)['apps']
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f'Failed to read {file_path}: {str(e)}')
+        return days
+
+
+class PeriodicFlusher:
+    """
+    Decide when accumulator totals are persisted to the daily file.
+
+    A flush is due when flush_interval seconds passed since the last one or
+    when at least dirty_threshold seconds were charged since then, whichever
+    comes first. A crash loses at most one flush window.
+    """
+
+    def __init__(self, flush_interval: float = 60, dirty_threshold: int = 300) -> None:
+        self.flush_interval = flush_interval
+        self.dirty_threshold = dirty_threshold
+        self.last_flush = time.monotonic()
+
+    def due(self, accumulator: TimeAccumulator) -> bool:
+        """
+        Check whether the accumulator should be flushed now.
+
+        :param accumulator: TimeAccumulator
+        :return: bool
+        """
+        if not accumulator.dirty:
+            return False
+        if accumulator.dirty >= self.dirty_threshold:
+            return True
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def take(self, accumulator: TimeAccumulator) -> tuple[dict[str, int], int]:
+        """
+        Take a copy of the totals to flush and mark the accumulator clean.
+
+        The copy can be written later, possibly from another thread.
+
+        :param accumulator: TimeAccumulator
+        :return: (totals, monotonic timestamp in nanoseconds the totals are valid up to)
+        """
+        totals = dict(accumulator.totals)
+        accumulator.mark_clean()
+        self.last_flush = time.monotonic()
+        return totals, accumulator.since
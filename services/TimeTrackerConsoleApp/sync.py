@@ -0,0 +1,125 @@
+import os
+import json
+import uuid
+import datetime
+import logging
+import threading
+from typing import Iterable, Optional
+
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaSync:
+    """
+    Track what the server acknowledged per day and app, so only increments are uploaded.
+
+    Every delta gets the next sequence number of this client. Until the server
+    acknowledges it, the delta stays pending and is resent unchanged with the
+    same sequence number, so a lost response never makes the server add the
+    same seconds twice. The state survives restarts in a small JSON file.
+    Acknowledged marks older than keep_days are dropped, unless their day is
+    still waiting for an upload.
+    """
+
+    def __init__(self, state_path: str, keep_days: int = 31) -> None:
+        self.state_path = state_path
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self.client_id = None
+        self.seq = 0
+        # {'yyyy-mm-dd': {app: seconds}} acknowledged by the server
+        self.acked = {}
+        self.pending = None
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            self.client_id = state['client_id']
+            self.seq = state['seq']
+            self.acked = state['acked']
+            self.pending = state.get('pending')
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f'Failed to read the sync state from {self.state_path}, starting over: {str(e)}')
+        if self.client_id is None:
+            self.client_id = uuid.uuid4().hex
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        atomic_write_json(self.state_path, {'client_id': self.client_id, 'seq': self.seq,
+                                            'acked': self.acked, 'pending': self.pending})
+
+    def next_delta(self, date: datetime.date, totals: dict[str, int]) -> Optional[dict]:
+        """
+        Get the delta to upload for a day.
+
+        A pending delta is returned as is, whatever day it belongs to, it has
+        to be acknowledged before a new one is built.
+
+        :param date: datetime.date
+        :param totals: dict {app: seconds} tracked locally on the day
+        :return: The request body, or None if the server is up to date
+        """
+        with self._lock:
+            if self.pending is not None:
+                return self.pending
+            acked = self.acked.get(str(date), {})
+            # Local totals only grow, anything below the mark was already sent
+            deltas = {app: seconds - acked.get(app, 0) for app, seconds in totals.items()
+                      if seconds > acked.get(app, 0)}
+            if not deltas:
+                return None
+            self.seq += 1
+            self.pending = {'client_id': self.client_id, 'seq': self.seq, 'date': str(date), 'deltas': deltas}
+            self._save()
+            return self.pending
+
+    def has_marks(self, date: datetime.date) -> bool:
+        """
+        Check if the marks of a day are known, or a delta of the day waits for acknowledgement.
+
+        :param date: datetime.date
+        :return: bool
+        """
+        with self._lock:
+            return str(date) in self.acked or (self.pending is not None and self.pending['date'] == str(date))
+
+    def seed(self, date: datetime.date, totals: dict[str, int]) -> None:
+        """
+        Raise the marks of a day to totals the server confirmed it holds, e.g. after a merge.
+
+        :param date: datetime.date
+        :param totals: dict {app: seconds} included in the server's tracked time of the day
+        :return: None
+        """
+        with self._lock:
+            acked = self.acked.setdefault(str(date), {})
+            for app, seconds in totals.items():
+                acked[app] = max(acked.get(app, 0), seconds)
+            self._save()
+
+    def acknowledge(self, delta: dict, keep: Iterable[datetime.date] = ()) -> None:
+        """
+        Move the high-water marks past a delta the server applied or already had.
+
+        :param delta: dict, as returned by next_delta()
+        :param keep: days whose marks are kept even if they are older than keep_days, the days still in the outbox
+        :return: None
+        """
+        with self._lock:
+            if self.pending is None or self.pending['seq'] != delta['seq']:
+                return
+            acked = self.acked.setdefault(delta['date'], {})
+            for app, seconds in delta['deltas'].items():
+                acked[app] = acked.get(app, 0) + seconds
+            self.pending = None
+            oldest = str(datetime.date.today() - datetime.timedelta(days=self.keep_days))
+            keep = {str(day) for day in keep}
+            self.acked = {day: apps for day, apps in self.acked.items() if day >= oldest or day in keep}
+            self._save()
@@ -0,0 +1,114 @@
+import os
+import sys
+import datetime
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import trackTime
+import utils
+from accumulator import TimeAccumulator
+from idle import ScriptedIdleSource
+from journal import journal_path_for, replay_journal
+from sampling import AdaptiveScheduler
+from storage import PartitionedStorage
+from window_source import ScriptedWindowSource
+
+MS = utils.NS_PER_SECOND // 1000
+
+
+class TimeAccumulatorTest(unittest.TestCase):
+
+    def test_fractional_intervals_are_charged_to_the_nanosecond(self):
+        accumulator = TimeAccumulator()
+        accumulator.switch('a.exe', 0)
+        accumulator.switch('b.exe', 1_250_000_001)
+        accumulator.switch('a.exe', 2_000_000_000)
+        accumulator.switch(None, 3_999_999_999)
+        self.assertEqual(accumulator.nanoseconds('a.exe'), 3_250_000_000)
+        self.assertEqual(accumulator.nanoseconds('b.exe'), 749_999_999)
+        self.assertEqual(accumulator.totals, {'a.exe': 3})
+        self.assertEqual(accumulator.leaderboard.top(), [('a.exe', 3)])
+
+    def test_resume_skips_the_suspended_time(self):
+        accumulator = TimeAccumulator({'a.exe': 10})
+        accumulator.switch('a.exe', 0)
+        accumulator.charge(500_000_000)
+        accumulator.resume(3_600_000_000_000)
+        accumulator.charge(3_600_750_000_000)
+        self.assertEqual(accumulator.nanoseconds('a.exe'), 11_250_000_000)
+        self.assertEqual(accumulator.seconds('a.exe'), 11)
+
+
+class TimeTrackerReplayTest(unittest.TestCase):
+    """
+    Replay synthetic traces through time_tracker() and check the totals to the millisecond.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.storage = trackTime.storage
+        self.addCleanup(setattr, trackTime, 'storage', self.storage)
+        trackTime.storage = PartitionedStorage(self.directory.name)
+        self.exclusions_path = os.path.join(self.directory.name, 'exclusions.json')
+        with open(self.exclusions_path, 'w') as f:
+            f.write('{}')
+
+    def track(self, source, scheduler=None):
+        trackTime.time_tracker(source, headless=True, exclusions_path=self.exclusions_path,
+                               scheduler=scheduler or AdaptiveScheduler(min_interval=1, max_interval=1))
+
+    def journal_totals(self, day):
+        return replay_journal(journal_path_for(trackTime.storage.file_path(day))).totals
+
+    def assertTotals(self, totals, expected):
+        self.assertEqual(totals.keys(), expected.keys())
+        for app, seconds in expected.items():
+            self.assertAlmostEqual(totals[app], seconds * utils.NS_PER_SECOND, delta=MS, msg=app)
+
+    def test_fractional_switches(self):
+        start = datetime.datetime(2026, 3, 10, 9).timestamp()
+        self.track(ScriptedWindowSource([(start, 'a.exe'), (start + 1.25, 'b.exe'), (start + 2.5005, 'a.exe'),
+                                         (start + 2.7, 'c.exe'), (start + 10.125, None)]))
+        self.assertTotals(self.journal_totals(datetime.date(2026, 3, 10)),
+                          {'a.exe': 1.4495, 'b.exe': 1.2505, 'c.exe': 7.425})
+
+    def test_midnight_splits_the_interval(self):
+        midnight = datetime.datetime(2026, 3, 11).timestamp()
+        self.track(ScriptedWindowSource([(midnight - 61.75, 'a.exe'), (midnight + 1.5, 'b.exe'),
+                                         (midnight + 4.25, None)]))
+        # The finished day was compacted into its daily file, which keeps whole seconds
+        self.assertEqual(trackTime.storage.read_day(datetime.date(2026, 3, 10)), {'a.exe': '00:01:01'})
+        self.assertTotals(self.journal_totals(datetime.date(2026, 3, 11)), {'a.exe': 1.5, 'b.exe': 2.75})
+
+    def test_suspend_gap_is_not_charged(self):
+        start = datetime.datetime(2026, 3, 10, 9).timestamp()
+        # The wait from start + 10 to start + 11 is interrupted by a suspend of 2989.75s
+        self.track(ScriptedWindowSource([(start, 'a.exe'), (start + 3600.5, None)],
+                                        suspended=[(start + 10.25, start + 3000)]))
+        # The whole interrupted wait is skipped, the time before and after it is charged
+        self.assertTotals(self.journal_totals(datetime.date(2026, 3, 10)), {'a.exe': 10 + 3600.5 - 3000.75})
+
+    def test_suspend_during_the_first_wait(self):
+        start = datetime.datetime(2026, 3, 10, 9).timestamp()
+        # Nothing was charged yet when the machine wakes up
+        source = ScriptedWindowSource([(start + 100.5, 'a.exe'), (start + 110.25, None)], start=start,
+                                      suspended=[(start + 0.5, start + 60)])
+        with self.assertNoLogs('pipeline', level='ERROR'), self.assertNoLogs('trackTime', level='ERROR'):
+            self.track(source)
+        self.assertTotals(self.journal_totals(datetime.date(2026, 3, 10)), {'a.exe': 9.75})
+
+    def test_idle_time_is_not_charged(self):
+        start = datetime.datetime(2026, 3, 10, 9).timestamp()
+        source = ScriptedWindowSource([(start, 'a.exe'), (start + 1000.5, 'b.exe'), (start + 1010.25, None)])
+        inputs = [start + i * 0.5 for i in range(201)] + [start + 1000.5 + i for i in range(10)]
+        self.track(source, AdaptiveScheduler(ScriptedIdleSource(inputs, source.now), min_interval=1,
+                                             max_interval=5, idle_threshold=300))
+        # a.exe stops at its last input, not once the idle threshold is reached
+        self.assertTotals(self.journal_totals(datetime.date(2026, 3, 10)), {'a.exe': 100, 'b.exe': 9.75})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import datetime
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbox import Outbox, OutboxDrainer
+
+
+class OutboxDrainerTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.outbox = Outbox(os.path.join(directory.name, 'outbox.json'))
+        self.days = [datetime.date(2026, 1, day) for day in (1, 2, 3)]
+        for day in self.days:
+            self.outbox.mark(day)
+        self.batches = []
+
+    def test_days_are_uploaded_in_batches(self):
+        drainer = OutboxDrainer(self.outbox, lambda days: self.batches.append(days) or set(days), batch_size=2)
+        self.assertTrue(drainer.drain())
+        self.assertFalse(drainer.drain())
+        self.assertEqual(self.batches, [self.days[:2], self.days[2:]])
+        self.assertEqual(self.outbox.pending(), [])
+
+    def test_day_marked_again_during_the_upload_stays(self):
+        def upload(days):
+            # The tracker writes the day again while its upload is in flight
+            self.outbox.mark(days[0])
+            return set(days)
+
+        drainer = OutboxDrainer(self.outbox, upload)
+        self.assertFalse(drainer.drain())
+        self.assertEqual([day for day, _ in self.outbox.pending()], self.days[:1])
+        self.assertEqual(drainer.failures, 0)
+
+    def test_partial_upload_backs_off_and_keeps_the_rest(self):
+        drainer = OutboxDrainer(self.outbox, lambda days: {days[1]})
+        self.assertIsNone(drainer.drain())
+        self.assertEqual(drainer.failures, 1)
+        self.assertEqual([day for day, _ in self.outbox.pending()], [self.days[0], self.days[2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from renderer import ConsoleRenderer, move_to
+
+
+class ConsoleRendererTest(unittest.TestCase):
+
+    def test_rows_are_cut_to_the_terminal_height(self):
+        stream = io.StringIO()
+        renderer = ConsoleRenderer(stream=stream)
+        rows = [(f'app{i}.exe', 1000 - i) for i in range(300)]
+        with mock.patch('shutil.get_terminal_size', return_value=os.terminal_size((80, 24))):
+            renderer.render(rows)
+        output = stream.getvalue()
+        self.assertIn(move_to(23) + ConsoleRenderer.format_row('app21.exe', 979), output)
+        self.assertNotIn('app22.exe', output)
+        self.assertTrue(output.endswith(move_to(24)))
+
+    def test_only_changed_rows_are_redrawn(self):
+        stream = io.StringIO()
+        renderer = ConsoleRenderer(max_rows=5, stream=stream)
+        renderer.render([('a.exe', 2), ('b.exe', 1)])
+        stream.truncate(0)
+        stream.seek(0)
+        renderer.render([('a.exe', 3), ('b.exe', 1)])
+        self.assertIn('a.exe', stream.getvalue())
+        self.assertNotIn('b.exe', stream.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
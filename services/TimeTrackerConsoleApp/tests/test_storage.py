@@ -0,0 +1,33 @@
+import os
+import sys
+import datetime
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import PartitionedStorage
+from sqlite_storage import SQLiteStorage
+
+
+class SQLiteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_days_between_reads_the_database(self):
+        # A JSON file left from before the switch is listed in the JSON index only
+        PartitionedStorage(self.directory.name).write_day(datetime.date(2026, 1, 1), {'apps': {'x.exe': '00:00:01'}})
+        storage = SQLiteStorage(self.directory.name)
+        self.addCleanup(storage._connection().close)
+        storage.write_day(datetime.date(2026, 1, 2), {'apps': {'a.exe': '00:00:01'}})
+        storage.write_day(datetime.date(2026, 1, 5), {'apps': {'a.exe': '00:00:01', 'b.exe': '00:00:02'}})
+        self.assertEqual(storage.days_between(datetime.date(2026, 1, 1), datetime.date(2026, 1, 5)),
+                         [(datetime.date(2026, 1, 2), storage.db_path), (datetime.date(2026, 1, 5), storage.db_path)])
+        self.assertEqual(storage.read_range(datetime.date(2026, 1, 1), datetime.date(2026, 1, 3)),
+                         {datetime.date(2026, 1, 2): {'a.exe': '00:00:01'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import sys
+import datetime
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main creates its sync state and outbox on import, keep them out of the real tracker folder
+state_directory = tempfile.TemporaryDirectory()
+os.environ['SYNC_STATE_FILE'] = os.path.join(state_directory.name, 'sync_state.json')
+os.environ['OUTBOX_FILE'] = os.path.join(state_directory.name, 'outbox.json')
+
+import main
+from sync import DeltaSync
+from outbox import Outbox
+
+
+def response(status_code, body):
+    return mock.Mock(status_code=status_code, json=mock.Mock(return_value=body))
+
+
+class UploadDaysTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.delta_sync = DeltaSync(os.path.join(directory.name, 'sync_state.json'))
+        self.outbox = Outbox(os.path.join(directory.name, 'outbox.json'))
+        self.client = mock.Mock()
+        self.client.post_days.side_effect = lambda jwt, records: response(
+            200, [{'index': i, 'date': r['date'], 'status': 'updated'} for i, r in enumerate(records)])
+        self.client.post_delta.return_value = response(200, {'applied': True})
+        # {day: {app: 'hh:mm:ss'}} tracked locally
+        self.apps = {}
+        for name, value in (('delta_sync', self.delta_sync), ('client', self.client), ('outbox', self.outbox),
+                            ('credentials', mock.Mock()), ('logger', logging.getLogger('main'))):
+            patcher = mock.patch.object(main, name, value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, value in (('set_jwt_token', mock.Mock(return_value=('jwt', 'refresh'))),
+                              ('trackTime.get_tracked_apps', lambda day: dict(self.apps.get(day, {})))):
+            patcher = mock.patch(f'main.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_days_without_marks_are_merged_in_one_request(self):
+        # The server may have these days already, e.g. after the sync state was lost
+        today = datetime.date.today()
+        old, recent = today - datetime.timedelta(days=90), today - datetime.timedelta(days=1)
+        self.delta_sync.seed(today, {'a.exe': 60})
+        self.apps = {old: {'a.exe': '00:00:10'}, recent: {'b.exe': '00:00:20'}, today: {'a.exe': '00:01:30'}}
+        self.assertEqual(main.upload_days([old, recent, today]), {old, recent, today})
+        self.client.post_days.assert_called_once_with('jwt', [{'date': str(old), 'apps': {'a.exe': '00:00:10'}},
+                                                              {'date': str(recent), 'apps': {'b.exe': '00:00:20'}}])
+        self.client.post_delta.assert_called_once()
+        self.assertEqual(self.client.post_delta.call_args[0][1]['deltas'], {'a.exe': 30})
+        self.assertEqual(self.delta_sync.acked[str(recent)], {'b.exe': 20})
+
+        # Once the marks are seeded only the time tracked since is added
+        self.apps[recent] = {'b.exe': '00:00:25'}
+        self.assertEqual(main.upload_days([recent]), {recent})
+        self.client.post_days.assert_called_once()
+        self.assertEqual(self.client.post_delta.call_args[0][1]['deltas'], {'b.exe': 5})
+
+    def test_merge_statuses_are_mapped_to_their_days(self):
+        today = datetime.date.today()
+        rejected, merged = today - datetime.timedelta(days=2), today - datetime.timedelta(days=1)
+        self.apps = {rejected: {'a.exe': '00:00:10'}, merged: {'a.exe': '00:00:20'}}
+        self.client.post_days.side_effect = None
+        self.client.post_days.return_value = response(200, [
+            {'index': 0, 'status': 'invalid', 'errors': ['Invalid JSON.']},
+            {'index': 1, 'date': str(merged), 'status': 'created'}])
+        # A rejected day is dropped without a delta, it would be rejected again
+        self.assertEqual(main.upload_days([rejected, merged]), {rejected, merged})
+        self.client.post_delta.assert_not_called()
+        self.assertFalse(self.delta_sync.has_marks(rejected))
+        self.assertEqual(self.delta_sync.acked[str(merged)], {'a.exe': 20})
+
+    def test_failed_merge_seeds_no_marks(self):
+        today = datetime.date.today()
+        self.client.post_days.side_effect = None
+        self.client.post_days.return_value = response(503, None)
+        self.apps = {today: {'a.exe': '00:01:00'}}
+        self.assertEqual(main.upload_days([today]), set())
+        self.client.post_delta.assert_not_called()
+        self.assertFalse(self.delta_sync.has_marks(today))
+
+    def test_marks_of_days_in_the_outbox_are_kept(self):
+        today = datetime.date.today()
+        waiting, uploaded = today - datetime.timedelta(days=60), today - datetime.timedelta(days=61)
+        self.delta_sync.seed(waiting, {'a.exe': 10})
+        self.delta_sync.seed(uploaded, {'a.exe': 10})
+        self.delta_sync.seed(today, {'a.exe': 10})
+        self.outbox.mark(waiting)
+        self.apps = {today: {'a.exe': '00:00:20'}}
+        self.assertEqual(main.upload_days([today]), {today})
+        # Without its marks the next upload of the waiting day would have to merge it again
+        self.assertTrue(self.delta_sync.has_marks(waiting))
+        self.assertFalse(self.delta_sync.has_marks(uploaded))
+
+
+class TokenRefreshTest(unittest.TestCase):
+
+    def test_rotated_refresh_token_is_stored(self):
+        client = mock.Mock()
+        client.refresh_token.return_value = response(200, {'access': 'new-jwt', 'refresh': 'new-refresh'})
+        credentials = mock.Mock()
+        credentials.get.side_effect = {'jwt': 'new-jwt', 'jwt_refresh': 'new-refresh'}.get
+        with mock.patch.object(main, 'client', client), mock.patch.object(main, 'credentials', credentials), \
+                mock.patch.object(main, 'logger', logging.getLogger('main'), create=True):
+            self.assertEqual(main.set_jwt_token('old-jwt', 'old-refresh', force_refresh=True),
+                             ('new-jwt', 'new-refresh'))
+        client.refresh_token.assert_called_once_with('old-refresh')
+        credentials.set.assert_any_call('jwt', 'new-jwt')
+        credentials.set.assert_any_call('jwt_refresh', 'new-refresh')
+
+
+if __name__ == '__main__':
+    unittest.main()
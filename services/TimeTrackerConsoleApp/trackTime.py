@@ -1,205 +1,282 @@
-from win32gui import GetForegroundWindow
-import win32process
-import psutil
-import time
 import os
+import queue
 import datetime
 import json
 import logging
 import utils
+from accumulator import TimeAccumulator
+from storage import PartitionedStorage, PeriodicFlusher
+from sqlite_storage import SQLiteStorage
+from exclusions import ExclusionRules
+from renderer import ConsoleRenderer
+from pipeline import SamplerThread, PersistenceThread, RendererThread
+from journal import journal_path_for, replay_journal, compact_stale_journals
+from outbox import Outbox
+from window_source import WindowSource, WindowsWindowSource
+from idle import WindowsIdleSource
+from sampling import AdaptiveScheduler
 
 logger = logging.getLogger(__name__)
 
 tracked_time_path = os.path.join(utils.BASE_PATH, 'TrackedTime')
 
-year_dir = os.path.join(tracked_time_path, str(datetime.datetime.now().year))
+# Daily files partitioned by year and month, see PartitionedStorage
+storage = PartitionedStorage(tracked_time_path)
 
-dir_name = datetime.datetime.today().strftime(
-    '%B') + '-' + str(datetime.datetime.today().year)
+# Totals of the running tracker, see publish_snapshot
+latest_snapshot = None
 
-month_dir = os.path.join(year_dir, dir_name)
 
-
-def clear():
+def use_sqlite_storage(db_path: str = None):
     """
-    Clear console.
+    Store the daily totals in a local SQLite database instead of JSON files.
+
+    The existing JSON files are imported when the database is empty.
+
+    :param db_path: The path of the database, TrackedTime/tracked_time.db by default.
     :return: None
     """
-    _ = os.system('cls')
+    global storage
+    storage = SQLiteStorage(tracked_time_path, db_path)
+    if storage.is_empty():
+        storage.import_json_tree()
 
 
-def create_folders():
-    # CREATING BASE DIR
+def create_folders(date: datetime.date = None):
     """
     Create directories for saving tracked time data, if they do not exist yet.
 
     Creates the following directories if they do not exist yet:
         - {BASE_PATH}/TrackedTime
-        - {BASE_PATH}/TrackedTime/{current_year}
-        - {BASE_PATH}/TrackedTime/{current_year}/{current_month}-{current_year}
+        - {BASE_PATH}/TrackedTime/{year}
+        - {BASE_PATH}/TrackedTime/{year}/{month}-{year}
+    for the given day and the day after it.
 
+    :param date: The day to create the directories for, today by default.
     :return: None
     """
-    if not os.path.isdir(tracked_time_path):
-        os.mkdir(tracked_time_path)
-
-    # CREATING YEAR DIR
-    if not os.path.isdir(year_dir):
-        os.mkdir(year_dir)
+    storage.ensure_partition(date or datetime.date.today())
 
-    # CREATING MONTH DIR
-    if not os.path.isdir(month_dir):
-        os.mkdir(month_dir)
 
-
-def get_file_name():
+def get_file_name(date: datetime.date = None):
     """
-    Returns the name of the file for the current day.
+    Returns the name of the file for the given day.
 
     The file name is in the format 'TrackedTime({date}).json'.
 
-    :return: The name of the file for the current day.
+    :param date: The day of the file, today by default.
+    :return: The name of the file for the day.
     """
-    file_name = f'TrackedTime({datetime.datetime.now().date()}).json'
-    return file_name
+    return os.path.basename(get_file_path(date))
 
 
-def get_file_path():
+def get_file_path(date: datetime.date = None):
     """
-    Returns the path of the file for the current day.
+    Returns the path of the file for the given day.
 
     The file name is in the format 'TrackedTime({date}).json' and is located in the directory
-    for the current month.
+    for the month of the day. The path is resolved on every call, so it follows day and month changes.
 
-    :return: The path of the file for the current day.
+    :param date: The day of the file, today by default.
+    :return: The path of the file for the day.
     """
-    # Get the name of the file for the current day.
-    file_name = get_file_name()
+    return storage.file_path(date or datetime.date.today())
 
-    # Construct the full path of the file.
-    file_path = os.path.join(month_dir, file_name)
 
-    return file_path
+def get_time_tracker_data(file_path):
+    """
+    Loads the time tracking data from the JSON file at the specified path.
 
+    The file is only read, never created or modified, so it is safe to call while the
+    tracker is writing it.
 
-def get_time_tracker_data(file_path):
+    :param file_path: The path of the file to load.
+    :return: The time tracking data from the file, or an empty dictionary if it doesn't exist or can't be read.
     """
-    Creates a new JSON file for time tracking at the specified path if it doesn't already exist.
-    If the file already exists, it loads the existing data from the file.
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)['apps']
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f'Failed to read tracked time from {file_path}: {str(e)}')
+        return {}
+
 
-    :param file_path: The path of the file to create or load.
-    :return: The existing time tracking data from the file, or an empty dictionary if the file is new.
+def publish_snapshot(day: datetime.date, accumulator: TimeAccumulator):
     """
-    current_year = datetime.datetime.now().year
-    current_month = datetime.datetime.now().month
-    current_day = datetime.datetime.now().day
+    Publish an immutable copy of the current totals for readers on other threads.
 
-    # The base structure of the JSON file.
-    json_base_template = {
-        'year': current_year,
-        'month': current_month,
-        'day': current_day,
-        'apps': {}  # The app data is stored here.
-    }
+    :param day: The day the totals belong to.
+    :param accumulator: The accumulator of the day.
+    :return: None
+    """
+    global latest_snapshot
+    # Replacing the reference is atomic, readers see either the old or the new snapshot
+    latest_snapshot = accumulator.snapshot(day)
 
-    json_apps_data = dict()
 
-    if not os.path.isfile(file_path):
-        # Create the file if it doesn't exist.
-        with open(file_path, 'w') as f:
-            json.dump(json_base_template, f, indent=4)
-    else:
-        try:
-            # Load the existing data from the file.
-            with open(file_path, 'r') as f:
-                json_data = json.load(f)
-                json_apps_data = json_data['apps']
-        except Exception as e:
-            # If there is an error loading the data, overwrite it with a new one.
-            with open(file_path, 'w') as f:
-                json.dump(json_base_template, f, indent=4)
-    return json_apps_data
+def get_tracked_apps(date: datetime.date = None):
+    """
+    Returns the tracked time of a day as {app: 'hh:mm:ss'}.
 
+    Uses the snapshot published by the running tracker when it covers the day, so the
+    uploader never reads a file the tracker is writing. Otherwise the day is read from
+    the storage, read-only.
 
-def time_tracker():
+    :param date: The day, today by default.
+    :return: dict
     """
-    Main time tracking function. This function will continuously run until stopped.
+    date = date or datetime.date.today()
+    snapshot = latest_snapshot
+    if snapshot is not None and snapshot.day == date:
+        return {app: utils.seconds_to_time(seconds) for app, seconds in snapshot.apps.items()}
+    return storage.read_day(date)
+
+
+def time_tracker(source: WindowSource = None, flush_interval: float = 60, flush_dirty_seconds: int = 300,
+                 exclusions_path: str = None, refresh_interval: float = 1, headless: bool = False,
+                 scheduler: AdaptiveScheduler = None, outbox: Outbox = None):
+    """
+    Main time tracking function. This function will run until stopped or until the source is closed.
 
     It will track the time of the current foreground window and store it in a JSON file.
     The JSON file will contain the time tracked for each app, sorted by the most time tracked.
+    Totals are kept in memory and written to the file every flush_interval seconds, or earlier
+    once flush_dirty_seconds seconds were tracked since the last write.
+    Sampling, persistence and rendering run on separate threads, so slow disk or console I/O
+    never delays the timestamps the durations are computed from.
+    When the tracker runs past midnight, the old day is finished and tracking continues in the
+    file of the new day.
+
+    :param source: The window source to read focus changes from, the win32 source by default.
+    :param flush_interval: Maximum number of seconds between two writes of the JSON file.
+    :param flush_dirty_seconds: Number of tracked seconds that triggers an early write.
+    :param exclusions_path: JSON file with the apps excluded from tracking, exclusions.json by default.
+    :param refresh_interval: Minimum number of seconds between two redraws of the table.
+    :param headless: Do not draw the table at all.
+    :param scheduler: Sampling scheduler with idle detection, uses GetLastInputInfo by default.
+    :param outbox: Outbox the written days are marked in for the uploader.
     """
-    # Exclude these apps from tracking
-    not_track = [
-        'Taskmgr', 'Explorer', 'Conemu64',
-        'Searchui', 'Shellexperiencehost',
-        'Lightshot', 'Steam', 'Applicationframehost',
-        'Steamwebhelper', 'Googledrivesync', 'Signalislandui',
-        'Tracktime', 'Minibin', 'Cmd', 'Lockapp', 'Startmenuexperiencehost',
-        'Pickerhost', ' Zoom_cm_ds_mf8tdjxyt1zsyrvv0dv7wdsk1rgxnsbvbj-8@2mw5xrbllwznevm9_kda7fbb901aef1905',
-        'Openwith', 'Genericsetup', 'Rundll32', 'Firstrun.exe', 'Systemsettingsadminflows', 'Msdt',
-        'Codesetupstabledddecbaecdddfdtmp',
-        'Easeofaccessdialog', 'Codesetup-stable-622cb03f7e070a9670c94bae1a45d78d7181fbd4.tmp'
-    ]
-
-    # Create base folders if they don't exist
-    create_folders()
-
-    # Clear console
-    clear()
-    print('Welcome to Time Tracker!')
-    
-    # Get the path of the JSON file
-    file_path = get_file_path()
+    # Apps excluded from tracking, the file is reloaded when it changes
+    exclusions = ExclusionRules(exclusions_path or os.path.join(utils.BASE_PATH, 'exclusions.json'))
 
-    # Get the existing data from the JSON file
-    json_apps_data = get_time_tracker_data(file_path)
+    if source is None:
+        source = WindowsWindowSource()
+        if scheduler is None:
+            scheduler = AdaptiveScheduler(WindowsIdleSource())
+    if scheduler is None:
+        scheduler = AdaptiveScheduler()
 
-    # Create a dictionary to store the timestamps of the apps
-    timestamp = {}
+    # The day the tracked time is charged to, decided by the wall clock
+    day = datetime.date.fromtimestamp(source.now())
 
-    # Start time tracking
-    while True:
-        try:
-            # Get the current foreground window
-            current_app = psutil.Process(
-                abs(win32process.GetWindowThreadProcessId(GetForegroundWindow())[1])).name().replace('.exe', '').capitalize()
-
-            # If the app is in the exclude list, skip it
-            if current_app in not_track:
-                # time.sleep(1)  # Without sleep caused an error
-                continue
+    # Create base folders if they don't exist
+    create_folders(day)
 
-            # Set the timestamp of the app to the current time
-            timestamp[current_app] = int(time.time())
+    # Clear console, the table is redrawn in place afterwards
+    renderer = ConsoleRenderer(refresh_interval, headless=headless)
+    renderer.start('Welcome to Time Tracker!')
 
-            # Sleep for 1 second before checking again
-            time.sleep(1)
+    # Turn the journals of previous days into their daily summaries
+    compacted_days = compact_stale_journals(storage, day)
+    if outbox is not None:
+        # A recovered day may hold time that never reached the server
+        for compacted_day in compacted_days:
+            outbox.mark(compacted_day)
 
-            # Update the time of the app in the data
-            json_apps_data.update({current_app: utils.seconds_to_time(
-                utils.time_to_seconds(json_apps_data.get(current_app, '00:00:00')) + int(time.time()) - timestamp[current_app])})
+    # Get the data that is already saved for today
+    json_apps_data = storage.read_day(day)
 
-            # Clear the console and print the updated data
-            clear()
+    persistence = PersistenceThread(storage, outbox=outbox)
 
-            json_apps_data = dict(sorted(json_apps_data.items(
-            ), key=lambda x: utils.time_to_seconds(x[1]), reverse=True))
-            for app, apptime in json_apps_data.items():
-                print('| %s: %-35s |' % (apptime, app))
+    journal_path = journal_path_for(get_file_path(day))
+    if os.path.isfile(journal_path):
+        # The journal is never behind the JSON file, rebuild the totals from it
+        totals = {app: ns // utils.NS_PER_SECOND for app, ns in replay_journal(journal_path).totals.items()}
+    else:
+        # Continue counting from the totals that are already saved
+        totals = {app: utils.time_to_seconds(apptime) for app, apptime in json_apps_data.items()}
+        persistence.record_base(day, totals)
+    persistence.record_start(day, source.monotonic_ns(), source.now())
 
-            # Write the updated data to the JSON file
-            with open(file_path, 'r') as f:
-                new_json = json.load(f)
-                new_json['apps'] = json_apps_data
-            with open(file_path, 'w') as f:
-                json.dump(new_json, f, indent=4)
+    accumulator = TimeAccumulator(totals)
+    publish_snapshot(day, accumulator)
 
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            # If the process doesn't exist, or we don't have access to it, or it's a zombie process, skip it
-            time.sleep(1)
-            pass
+    flusher = PeriodicFlusher(flush_interval, flush_dirty_seconds)
 
-        except Exception as e:
-            if e != KeyboardInterrupt:
-                logger.exception(f'Failed to track time: {str(e)}')
+    # Sampling, persistence and rendering run on their own threads,
+    # this thread only aggregates the samples
+    sampler = SamplerThread(source, scheduler, exclusions)
+    render_thread = RendererThread(renderer, accumulator.leaderboard)
+    persistence.start()
+    sampler.start()
+    if not headless:
+        render_thread.start()
 
+    # Start time tracking
+    try:
+        while True:
+            try:
+                # Wake up regularly so Ctrl+C is handled while no samples arrive
+                sample = sampler.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if sample is None:
+                break
+
+            sample_day = datetime.date.fromtimestamp(sample.wall_time)
+            if sample_day > day:
+                # Split the time at midnight, finish the old day and continue in the new one
+                midnight = datetime.datetime.combine(sample_day, datetime.time()).timestamp()
+                boundary_ns = sample.timestamp_ns - round((sample.wall_time - midnight) * utils.NS_PER_SECOND)
+                if accumulator.since is not None:
+                    boundary_ns = max(boundary_ns, accumulator.since)
+                app = accumulator.current_app
+                accumulator.switch(None, boundary_ns)
+                persistence.record_focus(day, None, boundary_ns)
+                persistence.flush(day, *flusher.take(accumulator))
+                publish_snapshot(day, accumulator)
+                persistence.finish_day(day)
+                logger.info(f'Day {day} finished, tracking {sample_day}')
+
+                day = sample_day
+                accumulator = TimeAccumulator()
+                render_thread.leaderboard = accumulator.leaderboard
+                persistence.record_start(day, boundary_ns, midnight)
+                accumulator.switch(app, boundary_ns)
+                persistence.record_focus(day, app, boundary_ns)
+
+            if sample.resumed:
+                # Nothing is charged for the time the machine was suspended
+                if accumulator.since is not None:
+                    persistence.record_focus(day, None, accumulator.since)
+                accumulator.resume(sample.timestamp_ns)
+                persistence.record_start(day, sample.timestamp_ns, sample.wall_time)
+                persistence.record_focus(day, accumulator.current_app, sample.timestamp_ns)
+
+            if sample.changed:
+                accumulator.switch(sample.app, sample.timestamp_ns)
+                persistence.record_focus(day, sample.app, sample.timestamp_ns)
+
+            # Charge the time up to the sample to the focused app
+            accumulator.charge(sample.timestamp_ns)
+
+            # Write the totals to the JSON file if a flush is due
+            if flusher.due(accumulator):
+                persistence.flush(day, *flusher.take(accumulator))
+                publish_snapshot(day, accumulator)
+    finally:
+        sampler.stop()
+        render_thread.stop()
+        # The sampler did not close the last interval if the tracker was interrupted
+        if accumulator.current_app is not None:
+            now = source.monotonic_ns()
+            accumulator.switch(None, now)
+            persistence.record_focus(day, None, now)
+        # Do not lose the last flush window when the tracker stops
+        persistence.flush(day, *flusher.take(accumulator))
+        publish_snapshot(day, accumulator)
+        persistence.stop()
+        persistence.join()
+        logger.info(f'Window source stats: {source.stats()}, sampler stats: {sampler.stats()}')
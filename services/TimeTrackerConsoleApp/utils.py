@@ -1,5 +1,6 @@
 import os
 BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+NS_PER_SECOND = 1_000_000_000
 
 
 def time_to_seconds(time: str) -> int:
@@ -0,0 +1,221 @@
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+
+class FocusEvent(NamedTuple):
+    """
+    A change of the foreground application.
+
+    app is None when the focused window could not be resolved to a process.
+    timestamp_ns is the time.monotonic_ns() value of the source clock when the change was seen.
+    """
+    app: Optional[str]
+    pid: int
+    timestamp_ns: int
+
+
+class WindowSource(ABC):
+    """
+    Source of foreground window changes.
+
+    Implementations only report transitions: next_event() returns a FocusEvent
+    when the focused application changed and None when nothing changed before
+    the timeout expired.
+    """
+    closed = False
+
+    def now(self) -> float:
+        """
+        Current wall clock time of the source, only used to find the current day.
+
+        :return: float
+        """
+        return time.time()
+
+    def monotonic_ns(self) -> int:
+        """
+        Current monotonic time of the source in nanoseconds, used for all durations.
+
+        :return: int
+        """
+        return time.monotonic_ns()
+
+    def stats(self) -> dict:
+        """
+        Counters describing the work done by the source, for logging.
+
+        :return: dict
+        """
+        return {}
+
+    @abstractmethod
+    def next_event(self, timeout: float) -> Optional[FocusEvent]:
+        """
+        Wait up to timeout seconds for the next focus change.
+
+        :param timeout: float
+        :return: FocusEvent or None
+        """
+
+
+# SetWinEventHook and MsgWaitForMultipleObjectsEx constants, see WindowsWindowSource
+EVENT_SYSTEM_FOREGROUND = 0x0003
+WINEVENT_OUTOFCONTEXT = 0x0000
+QS_ALLINPUT = 0x04FF
+MWMO_INPUTAVAILABLE = 0x0004
+PM_REMOVE = 0x0001
+
+
+class WindowsWindowSource(WindowSource):
+    """
+    Foreground window source backed by the win32 API.
+
+    Foreground changes are reported by a SetWinEventHook(EVENT_SYSTEM_FOREGROUND)
+    hook. The hook belongs to the thread that calls next_event(), which waits
+    in MsgWaitForMultipleObjectsEx until the hook fires or the timeout expires,
+    so a focus change is seen right away and a stable focus costs no wakeups
+    besides the caller's timeout. The foreground window is also checked once
+    per timeout, which is all that is left if the hook can't be installed.
+    The process name is only resolved when the window or its process changes.
+    """
+
+    def __init__(self) -> None:
+        # Imported here so the rest of the tracker can run without pywin32 and psutil
+        import ctypes
+        from ctypes import wintypes
+        import win32gui
+        import win32process
+        from process_cache import ProcessNameCache
+        self._ctypes = ctypes
+        self._win32gui = win32gui
+        self._win32process = win32process
+        self._user32 = ctypes.windll.user32
+        self._kernel32 = ctypes.windll.kernel32
+        self._user32.SetWinEventHook.restype = wintypes.HANDLE
+        self._user32.MsgWaitForMultipleObjectsEx.argtypes = [wintypes.DWORD, ctypes.c_void_p, wintypes.DWORD,
+                                                             wintypes.DWORD, wintypes.DWORD]
+        self._user32.PeekMessageW.argtypes = [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT,
+                                              wintypes.UINT, wintypes.UINT]
+        self._kernel32.GetTickCount.restype = wintypes.DWORD
+        self._event_proc_type = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                                   wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        self._msg = wintypes.MSG()
+        self.process_names = ProcessNameCache()
+        # Set on the first next_event() call, the hook must belong to the waiting thread
+        self._event_proc = None
+        self._hook = None
+        # Monotonic time of the last foreground change reported by the hook, not handled yet
+        self._changed_ns = None
+        self._hwnd = None
+        self._pid = None
+        self._app = None
+
+    def stats(self) -> dict:
+        return self.process_names.stats()
+
+    def _install_hook(self) -> None:
+        # The callback object must stay referenced as long as the hook exists
+        self._event_proc = self._event_proc_type(self._on_foreground)
+        self._hook = self._user32.SetWinEventHook(EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, None,
+                                                  self._event_proc, 0, 0, WINEVENT_OUTOFCONTEXT)
+        if not self._hook:
+            logger.warning('SetWinEventHook failed, the foreground window is only checked once per sample')
+
+    def _on_foreground(self, hook, event, hwnd, id_object, id_child, thread_id, event_time) -> None:
+        # event_time is a GetTickCount() value, both wrap around after ~49 days
+        elapsed_ms = (self._kernel32.GetTickCount() - event_time) & 0xFFFFFFFF
+        self._changed_ns = self.monotonic_ns() - elapsed_ms * 1_000_000
+
+    def _pump(self) -> None:
+        # Out of context hooks are called while the thread's messages are retrieved
+        msg = self._ctypes.byref(self._msg)
+        while self._user32.PeekMessageW(msg, None, 0, 0, PM_REMOVE):
+            self._user32.TranslateMessage(msg)
+            self._user32.DispatchMessageW(msg)
+
+    def _poll(self, timestamp_ns: Optional[int] = None) -> Optional[FocusEvent]:
+        hwnd = self._win32gui.GetForegroundWindow()
+        if hwnd == self._hwnd:
+            return None
+        self._hwnd = hwnd
+        pid = abs(self._win32process.GetWindowThreadProcessId(hwnd)[1])
+        if pid == self._pid:
+            return None
+        self._pid = pid
+        app = self.process_names.get(pid)
+        if app == self._app:
+            return None
+        self._app = app
+        return FocusEvent(app, pid, self.monotonic_ns() if timestamp_ns is None else timestamp_ns)
+
+    def next_event(self, timeout: float) -> Optional[FocusEvent]:
+        if self._event_proc is None:
+            self._install_hook()
+        deadline = time.monotonic() + timeout
+        while True:
+            self._pump()
+            if self._changed_ns is not None:
+                changed_ns, self._changed_ns = self._changed_ns, None
+                event = self._poll(changed_ns)
+                if event is not None:
+                    return event
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._poll()
+            if self._hook:
+                # Wakes up for the hook's messages, or when the timeout expires
+                self._user32.MsgWaitForMultipleObjectsEx(0, None, max(1, round(remaining * 1000)), QS_ALLINPUT,
+                                                         MWMO_INPUTAVAILABLE)
+            else:
+                time.sleep(remaining)
+
+
+class ScriptedWindowSource(WindowSource):
+    """
+    Fake window source that replays a scripted list of focus changes.
+
+    The script is a list of (timestamp, app) pairs sorted by timestamp, in
+    seconds. The same virtual clock serves as wall and monotonic time. Time is
+    virtual: next_event() never sleeps, it advances the source clock instead,
+    which makes the tracker usable for tests and benchmarks on any platform.
+    The source is closed once the script is exhausted. suspended lists
+    (start, end) periods during which the machine sleeps.
+    """
+
+    def __init__(self, script: list[tuple[float, Optional[str]]], start: Optional[float] = None,
+                 suspended: list[tuple[float, float]] = ()) -> None:
+        self._script = list(script)
+        self._suspended = list(suspended)
+        self._position = 0
+        if start is None:
+            start = self._script[0][0] if self._script else 0.0
+        self.clock = start
+
+    def now(self) -> float:
+        return self.clock
+
+    def monotonic_ns(self) -> int:
+        return round(self.clock * utils.NS_PER_SECOND)
+
+    def next_event(self, timeout: float) -> Optional[FocusEvent]:
+        if self._position >= len(self._script):
+            self.closed = True
+            return None
+        timestamp, app = self._script[self._position]
+        target = self.clock + timeout
+        for start, end in self._suspended:
+            # A wait that overlaps a suspension returns late, like a real sleep would
+            if self.clock <= start < target:
+                target += end - start
+        if timestamp > target:
+            self.clock = target
+            return None
+        self._position += 1
+        self.clock = max(self.clock, timestamp)
+        return FocusEvent(app, self._position, round(timestamp * utils.NS_PER_SECOND))
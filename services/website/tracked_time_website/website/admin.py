@@ -1,5 +1,42 @@
 from django.contrib import admin
-from .models import TrackedTime
+from django.db import transaction
+from .models import (TrackedTime, SyncClient, AppUsage, Application, AppRollup, apply_rollup_deltas, lock_users,
+                     remove_app_usages)
 # Register your models here.
 
-admin.site.register(TrackedTime)
+
+class TrackedTimeAdmin(admin.ModelAdmin):
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        # The bulk delete skips TrackedTime.delete(), take the usages out of the rollups here
+        remove_app_usages(AppUsage.objects.filter(tracked_time__in=queryset))
+        queryset.delete()
+
+
+class AppUsageAdmin(admin.ModelAdmin):
+    """
+    Usages edited here update the rollups like upsert_app_usages() and remove_app_usages() do.
+    """
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        old = AppUsage.objects.filter(pk=obj.pk) if change else AppUsage.objects.none()
+        lock_users({obj.tracked_time.user_id, *old.values_list("tracked_time__user_id", flat=True)})
+        deltas = [(user_id, day, application_id, -seconds) for user_id, day, application_id, seconds in
+                  old.values_list("tracked_time__user_id", "tracked_time__date", "application_id", "seconds")]
+        super().save_model(request, obj, form, change)
+        apply_rollup_deltas(deltas + [(obj.tracked_time.user_id, obj.tracked_time.date, obj.application_id,
+                                       obj.seconds)])
+
+    def delete_model(self, request, obj):
+        remove_app_usages(AppUsage.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        remove_app_usages(queryset)
+
+
+admin.site.register(TrackedTime, TrackedTimeAdmin)
+admin.site.register(SyncClient)
+admin.site.register(AppUsage, AppUsageAdmin)
+admin.site.register(Application)
+admin.site.register(AppRollup)
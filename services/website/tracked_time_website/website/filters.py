@@ -0,0 +1,51 @@
+import calendar
+from datetime import date
+
+import django_filters
+
+from .models import TrackedTime
+
+
+class TrackedTimeFilter(django_filters.FilterSet):
+    """
+    The ?year=&month=&day= filters of the former columns, as a date range.
+
+    A year, a year and a month, or a full date become a range on the date
+    column, which the (user, date) index serves. Without a year, months and
+    days are matched on the extracted parts of the date.
+    """
+    year = django_filters.NumberFilter(method='filter_date')
+    month = django_filters.NumberFilter(method='filter_date')
+    day = django_filters.NumberFilter(method='filter_date')
+
+    class Meta:
+        model = TrackedTime
+        fields = ['year', 'month', 'day']
+
+    def filter_date(self, queryset, name, value):
+        # All three parameters are handled together, once
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        year, month, day = (self.form.cleaned_data.get(name) for name in ('year', 'month', 'day'))
+        year, month, day = (int(value) if value is not None else None for value in (year, month, day))
+        if year is None:
+            if month is not None:
+                queryset = queryset.filter(date__month=month)
+            if day is not None:
+                queryset = queryset.filter(date__day=day)
+            return queryset
+        try:
+            if month is None:
+                start, end = date(year, 1, 1), date(year, 12, 31)
+                if day is not None:
+                    return queryset.filter(date__range=(start, end), date__day=day)
+            elif day is None:
+                start, end = date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+            else:
+                return queryset.filter(date=date(year, month, day))
+        except ValueError:
+            # Like the former integer columns, an impossible date matches nothing
+            return queryset.none()
+        return queryset.filter(date__range=(start, end))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from website.rollups import rebuild_rollups, verify_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekly, monthly, yearly and all time rollups from the usages, or verify them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["rebuild", "verify"])
+        parser.add_argument("--user", type=int, action="append", dest="user_ids",
+                            help="Only the rollups of this user id, can be repeated.")
+
+    def handle(self, *args, **options):
+        if options["action"] == "rebuild":
+            count = rebuild_rollups(options["user_ids"])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollups"))
+            return
+        mismatches = verify_rollups(options["user_ids"])
+        for (user_id, period, start, application_id), expected, stored in mismatches[:50]:
+            self.stdout.write(f"user id:{user_id} {period} {start} application id:{application_id}: "
+                              f"expected {expected}s, stored {stored}s")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollups differ from the usages, run: manage.py rollups rebuild")
+        self.stdout.write(self.style.SUCCESS("Rollups match the usages"))
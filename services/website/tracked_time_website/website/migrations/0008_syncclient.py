@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_alter_trackedtime_day'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(max_length=64)),
+                ('last_seq', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='syncclients', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'SyncClient',
+                'verbose_name_plural': 'SyncClients',
+                'constraints': [models.UniqueConstraint(fields=('user', 'client_id'), name='unique_sync_client')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def time_to_seconds(time):
+    hours, minutes, seconds = map(int, str(time).split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def seconds_to_time(seconds):
+    return '{:02}:{:02}:{:02}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def copy_apps_to_usages(apps, schema_editor):
+    TrackedTime = apps.get_model('website', 'TrackedTime')
+    AppUsage = apps.get_model('website', 'AppUsage')
+    usages = []
+    for tracked_time in TrackedTime.objects.only('id', 'apps').iterator(chunk_size=2000):
+        for app, time in (tracked_time.apps or {}).items():
+            try:
+                seconds = time_to_seconds(time)
+            except ValueError:
+                continue
+            usages.append(AppUsage(tracked_time_id=tracked_time.id, app=str(app)[:255], seconds=seconds))
+        if len(usages) >= 5000:
+            AppUsage.objects.bulk_create(usages, ignore_conflicts=True)
+            usages = []
+    AppUsage.objects.bulk_create(usages, ignore_conflicts=True)
+
+
+def copy_usages_to_apps(apps, schema_editor):
+    TrackedTime = apps.get_model('website', 'TrackedTime')
+    AppUsage = apps.get_model('website', 'AppUsage')
+    tracked_times = {}
+    for usage in AppUsage.objects.order_by('tracked_time_id', '-seconds').iterator(chunk_size=5000):
+        tracked_times.setdefault(usage.tracked_time_id, {})[usage.app] = seconds_to_time(usage.seconds)
+    for tracked_time_id, tracked_apps in tracked_times.items():
+        TrackedTime.objects.filter(id=tracked_time_id).update(apps=tracked_apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_syncclient'),
+    ]
+
+    operations = [
+        # Lets the field be added back with a value when the migration is reversed
+        migrations.AlterField(
+            model_name='trackedtime',
+            name='apps',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.CreateModel(
+            name='AppUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app', models.CharField(max_length=255)),
+                ('seconds', models.PositiveIntegerField(default=0)),
+                ('tracked_time', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='website.trackedtime')),
+            ],
+            options={
+                'verbose_name': 'AppUsage',
+                'verbose_name_plural': 'AppUsages',
+                'indexes': [models.Index(fields=['app'], name='app_usage_app')],
+                'constraints': [models.UniqueConstraint(fields=('tracked_time', 'app'), name='unique_app_usage')],
+            },
+        ),
+        migrations.RunPython(copy_apps_to_usages, copy_usages_to_apps),
+        migrations.RemoveField(
+            model_name='trackedtime',
+            name='apps',
+        ),
+    ]
@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0009_appusage'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='appusage',
+            name='unique_app_usage',
+        ),
+        migrations.RemoveIndex(
+            model_name='appusage',
+            name='app_usage_app',
+        ),
+        migrations.CreateModel(
+            name='Application',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('alias_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='aliases', to='website.application')),
+            ],
+            options={
+                'verbose_name': 'Application',
+                'verbose_name_plural': 'Applications',
+            },
+        ),
+        migrations.AddField(
+            model_name='appusage',
+            name='application',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='usages', to='website.application'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def link_applications(apps, schema_editor):
+    Application = apps.get_model('website', 'Application')
+    AppUsage = apps.get_model('website', 'AppUsage')
+    names = AppUsage.objects.values_list('app', flat=True).distinct()
+    Application.objects.bulk_create([Application(name=name) for name in names], ignore_conflicts=True)
+    for id, name in Application.objects.values_list('id', 'name'):
+        AppUsage.objects.filter(app=name).update(application_id=id)
+
+
+def unlink_applications(apps, schema_editor):
+    Application = apps.get_model('website', 'Application')
+    AppUsage = apps.get_model('website', 'AppUsage')
+    for id, name in Application.objects.values_list('id', 'name'):
+        AppUsage.objects.filter(application_id=id).update(app=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0010_application'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_applications, unlink_applications),
+    ]
@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0011_appusage_application_data'),
+    ]
+
+    operations = [
+        # Lets the field be added back with a value when the migration is reversed
+        migrations.AlterField(
+            model_name='appusage',
+            name='app',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='appusage',
+            name='app',
+        ),
+        migrations.AlterField(
+            model_name='appusage',
+            name='application',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='usages', to='website.application'),
+        ),
+        migrations.AddConstraint(
+            model_name='appusage',
+            constraint=models.UniqueConstraint(fields=('tracked_time', 'application'), name='unique_app_usage'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0012_remove_appusage_app'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackedtime',
+            name='date',
+            field=models.DateField(null=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import datetime
+
+from django.db import migrations
+
+
+def fill_dates(apps, schema_editor):
+    TrackedTime = apps.get_model('website', 'TrackedTime')
+    AppUsage = apps.get_model('website', 'AppUsage')
+    kept = {}
+    for tracked_time in TrackedTime.objects.order_by('id').iterator(chunk_size=2000):
+        date = datetime.date(tracked_time.year, tracked_time.month, tracked_time.day)
+        key = (tracked_time.user_id, date)
+        if key not in kept:
+            kept[key] = tracked_time.id
+            TrackedTime.objects.filter(id=tracked_time.id).update(date=date)
+            continue
+        # A duplicate of the day, the larger time of every app is kept in the oldest row
+        seconds = dict(AppUsage.objects.filter(tracked_time_id=kept[key]).values_list('application_id', 'seconds'))
+        for usage in AppUsage.objects.filter(tracked_time_id=tracked_time.id):
+            if usage.application_id not in seconds:
+                AppUsage.objects.filter(id=usage.id).update(tracked_time_id=kept[key])
+            elif usage.seconds > seconds[usage.application_id]:
+                AppUsage.objects.filter(tracked_time_id=kept[key], application_id=usage.application_id).update(
+                    seconds=usage.seconds)
+        TrackedTime.objects.filter(id=tracked_time.id).delete()
+
+
+def fill_year_month_day(apps, schema_editor):
+    TrackedTime = apps.get_model('website', 'TrackedTime')
+    for tracked_time in TrackedTime.objects.iterator(chunk_size=2000):
+        TrackedTime.objects.filter(id=tracked_time.id).update(
+            year=tracked_time.date.year, month=tracked_time.date.month, day=tracked_time.date.day)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0013_trackedtime_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_dates, fill_year_month_day),
+    ]
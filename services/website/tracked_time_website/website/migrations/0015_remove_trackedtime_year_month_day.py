@@ -0,0 +1,37 @@
+import datetime
+
+import website.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0014_trackedtime_date_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trackedtime',
+            name='day',
+        ),
+        migrations.RemoveField(
+            model_name='trackedtime',
+            name='month',
+        ),
+        migrations.RemoveField(
+            model_name='trackedtime',
+            name='year',
+        ),
+        migrations.AlterField(
+            model_name='trackedtime',
+            name='date',
+            field=models.DateField(db_default=website.models.CurrentDate(), default=datetime.date.today, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='trackedtime',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_tracked_time_day'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    AppUsage = apps.get_model('website', 'AppUsage')
+    AppRollup = apps.get_model('website', 'AppRollup')
+    rollups = {}
+    for user_id, date, application_id, seconds in AppUsage.objects.values_list(
+            'tracked_time__user_id', 'tracked_time__date', 'application_id', 'seconds').iterator(chunk_size=5000):
+        starts = [('week', date - datetime.timedelta(days=date.weekday())), ('month', date.replace(day=1)),
+                  ('year', date.replace(month=1, day=1)), ('all', datetime.date.min)]
+        for period, start in starts:
+            key = (user_id, period, start, application_id)
+            rollups[key] = rollups.get(key, 0) + seconds
+    AppRollup.objects.bulk_create([AppRollup(user_id=user_id, period=period, start=start,
+                                             application_id=application_id, seconds=seconds)
+                                   for (user_id, period, start, application_id), seconds in rollups.items()
+                                   if seconds], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0015_remove_trackedtime_year_month_day'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('year', 'Year'), ('all', 'All time')], max_length=5)),
+                ('start', models.DateField()),
+                ('seconds', models.BigIntegerField(default=0)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='rollups', to='website.application')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'AppRollup',
+                'verbose_name_plural': 'AppRollups',
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'start', 'application'), name='unique_app_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
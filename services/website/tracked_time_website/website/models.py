@@ -1,18 +1,367 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
-from datetime import datetime
+from datetime import date
+import threading
+
+from .utils import seconds_to_time
 # Create your models here.
 
+class CurrentDate(models.Func):
+    """
+    The current date of the database server, CURRENT_DATE in SQL.
+    """
+    template = "CURRENT_DATE"
+    output_field = models.DateField()
+
+
 class TrackedTime(models.Model):
     user = models.ForeignKey(User, related_name="trackedtimes", on_delete=models.CASCADE)
-    year = models.IntegerField(editable=False, blank=False, default=datetime.now().year)
-    month = models.IntegerField(editable=False, blank=False, default=datetime.now().month)
-    day = models.IntegerField(editable=False, blank=False, default=datetime.now().day)
-    apps = models.JSONField()
+    # The default is evaluated per row, rows inserted without the ORM get the date of the database
+    date = models.DateField(editable=False, default=date.today, db_default=CurrentDate())
 
     class Meta:
         verbose_name = "TrackedTime"
         verbose_name_plural = "TrackedTimes"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "date"], name="unique_tracked_time_day"),
+        ]
+    def __str__(self):
+        return f"Tracked time({self.date}) for user id:{self.user_id}"
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        # Queryset deletes skip this, they must call remove_app_usages() first, see TrackedTimeAdmin
+        remove_app_usages(self.usages.all())
+        return super().delete(*args, **kwargs)
+
+    @property
+    def app_seconds(self) -> dict:
+        """
+        The tracked seconds per app, sorted by the most time tracked.
+
+        Uses the prefetched usages if there are any.
+        """
+        usages = list(self.usages.all())
+        names = application_cache.names([usage.application_id for usage in usages])
+        # Usages of an alias written by a process that didn't know the alias yet count for its application
+        totals = {}
+        for usage in usages:
+            name = names[usage.application_id]
+            totals[name] = totals.get(name, 0) + usage.seconds
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    @property
+    def apps(self) -> dict:
+        """
+        The tracked time per app as hh:mm:ss strings, the shape of the former JSON field.
+        """
+        return {app: seconds_to_time(seconds) for app, seconds in self.app_seconds.items()}
+
+    def set_app_seconds(self, totals: dict, replace: bool = False) -> None:
+        """
+        Store the tracked seconds of the given apps.
+
+        Other apps are left as they are, or deleted if replace is set.
+        """
+        if replace:
+            remove_app_usages(self.usages.exclude(application_id__in=application_cache.ids(totals).values()))
+        upsert_app_usages([(self, app, seconds) for app, seconds in totals.items()])
+        # Prefetched usages are outdated now
+        getattr(self, '_prefetched_objects_cache', {}).pop('usages', None)
+
+
+class Application(models.Model):
+    """
+    An app name, usages refer to it by id.
+
+    An application with alias_of set is another name of that application,
+    its time is stored under the application it is an alias of. Saving an
+    alias moves the time already stored under it, see merge_alias_usages().
+    """
+    name = models.CharField(max_length=255, unique=True)
+    alias_of = models.ForeignKey("self", related_name="aliases", null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        verbose_name = "Application"
+        verbose_name_plural = "Applications"
     def __str__(self):
-        return f"Tracked time(d-{self.day}, m-{self.month}, y-{self.year}) for user id:{self.user.id}"
+        return self.name if self.alias_of_id is None else f"{self.name} (alias of id:{self.alias_of_id})"
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.alias_of_id is not None and self.alias_of_id != self.id:
+            merge_alias_usages(self)
+
+
+class ApplicationCache:
+    """
+    Process-wide cache of application names and ids.
+
+    Names are resolved through aliases, ids() returns the id of the
+    application a name stands for and names() its name, for the ids of
+    aliases too. Applications are created on first use. What is read inside
+    a transaction is only cached once it commits, so rolled back rows never
+    stay in the cache. The cache is cleared when an application of this
+    process changes, other processes pick up new aliases after a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._names = {}
+
+    def _load(self, applications) -> tuple:
+        applications = list(applications)
+        targets = {application.alias_of_id for application in applications if application.alias_of_id}
+        target_names = dict(Application.objects.filter(id__in=targets).values_list("id", "name")) if targets else {}
+        ids, names = {}, {}
+        for application in applications:
+            target = application.alias_of_id or application.id
+            ids[application.name] = target
+            names[application.id] = names[target] = target_names.get(target, application.name)
+        transaction.on_commit(lambda: self._store(ids, names))
+        return ids, names
+
+    def _store(self, ids: dict, names: dict) -> None:
+        with self._lock:
+            self._ids.update(ids)
+            self._names.update(names)
+
+    def _cached(self, cache: dict, keys: set) -> dict:
+        with self._lock:
+            return {key: cache[key] for key in keys if key in cache}
+
+    def ids(self, names) -> dict:
+        """
+        Get the ids of app names, missing applications are created.
+        """
+        names = set(names)
+        ids = self._cached(self._ids, names)
+        missing = names - ids.keys()
+        if missing:
+            Application.objects.bulk_create([Application(name=name) for name in missing], ignore_conflicts=True)
+            ids.update(self._load(Application.objects.filter(name__in=missing))[0])
+        return ids
+
+    def names(self, ids) -> dict:
+        """
+        Get the names of application ids.
+        """
+        ids = set(ids)
+        names = self._cached(self._names, ids)
+        missing = ids - names.keys()
+        if missing:
+            names.update(self._load(Application.objects.filter(id__in=missing))[1])
+        return {id: names[id] for id in ids}
+
+    def canonical(self, app_seconds: dict) -> dict:
+        """
+        Rename aliases in per-app seconds to the application they stand for, summing their seconds.
+        """
+        ids = self.ids(app_seconds)
+        names = self.names(ids.values())
+        totals = {}
+        for app, seconds in app_seconds.items():
+            name = names[ids[app]]
+            totals[name] = totals.get(name, 0) + seconds
+        return totals
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+
+application_cache = ApplicationCache()
+
+
+@receiver([post_save, post_delete], sender=Application)
+def clear_application_cache(sender, **kwargs):
+    application_cache.clear()
+    # Names loaded earlier in the transaction are cached when it commits, clear them again after that
+    transaction.on_commit(application_cache.clear)
 
+
+class AppUsage(models.Model):
+    """
+    The seconds tracked for one application on the day of a TrackedTime.
+    """
+    tracked_time = models.ForeignKey(TrackedTime, related_name="usages", on_delete=models.CASCADE)
+    application = models.ForeignKey(Application, related_name="usages", on_delete=models.PROTECT)
+    seconds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "AppUsage"
+        verbose_name_plural = "AppUsages"
+        constraints = [
+            models.UniqueConstraint(fields=["tracked_time", "application"], name="unique_app_usage"),
+        ]
+    def __str__(self):
+        return f"{self.application}: {seconds_to_time(self.seconds)} on tracked time id:{self.tracked_time_id}"
+
+
+class AppRollup(models.Model):
+    """
+    The seconds tracked for one application by a user in a week, a month, a year or all time.
+
+    start is the first day of the period, Monday for weeks, and date.min for
+    all time. Rollups are kept up to date with the deltas of every usage
+    change made through upsert_app_usages() and remove_app_usages(), see
+    apply_rollup_deltas(). The rollups command rebuilds and verifies them.
+    """
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+    ALL = "all"
+    PERIODS = [(WEEK, "Week"), (MONTH, "Month"), (YEAR, "Year"), (ALL, "All time")]
+
+    user = models.ForeignKey(User, related_name="rollups", on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIODS)
+    start = models.DateField()
+    application = models.ForeignKey(Application, related_name="rollups", on_delete=models.PROTECT)
+    seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "AppRollup"
+        verbose_name_plural = "AppRollups"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "period", "start", "application"], name="unique_app_rollup"),
+        ]
+    def __str__(self):
+        return f"{self.application}: {seconds_to_time(self.seconds)} in {self.period} of {self.start} for user id:{self.user_id}"
+
+    @staticmethod
+    def period_start(period: str, day: date) -> date:
+        """
+        The first day of the period the day is in.
+        """
+        if period == AppRollup.WEEK:
+            return date.fromordinal(day.toordinal() - day.weekday())
+        if period == AppRollup.MONTH:
+            return day.replace(day=1)
+        if period == AppRollup.YEAR:
+            return day.replace(month=1, day=1)
+        return date.min
+
+
+def apply_rollup_deltas(deltas) -> None:
+    """
+    Add (user_id, date, application_id, seconds) deltas to the rollups of every period.
+
+    Must run in the transaction that changes the usages, with the users locked.
+    """
+    totals = {}
+    for user_id, day, application_id, seconds in deltas:
+        if seconds:
+            for period, _ in AppRollup.PERIODS:
+                key = (user_id, period, AppRollup.period_start(period, day), application_id)
+                totals[key] = totals.get(key, 0) + seconds
+    totals = {key: seconds for key, seconds in totals.items() if seconds}
+    if not totals:
+        return
+    existing = AppRollup.objects.filter(
+        user_id__in={key[0] for key in totals}, start__in={key[2] for key in totals},
+        application_id__in={key[3] for key in totals})
+    to_update = []
+    for rollup in existing:
+        key = (rollup.user_id, rollup.period, rollup.start, rollup.application_id)
+        if key in totals:
+            rollup.seconds += totals.pop(key)
+            to_update.append(rollup)
+    AppRollup.objects.bulk_update(to_update, ["seconds"])
+    AppRollup.objects.bulk_create([AppRollup(user_id=user_id, period=period, start=start, application_id=application_id,
+                                             seconds=seconds)
+                                   for (user_id, period, start, application_id), seconds in totals.items()
+                                   if seconds > 0])
+
+
+def lock_users(user_ids) -> None:
+    """
+    Lock users for the rest of the transaction, their usages and rollups are only changed by one writer at a time.
+    """
+    list(User.objects.select_for_update().filter(pk__in=user_ids).order_by("pk").values_list("pk"))
+
+
+@transaction.atomic
+def upsert_app_usages(usages: list) -> None:
+    """
+    Insert or update (tracked_time, app, seconds) usages in one statement.
+
+    The seconds of an existing row are replaced and the rollups get the
+    difference. Apps must already be resolved through aliases, see
+    ApplicationCache.canonical().
+    """
+    if not usages:
+        return
+    lock_users({tracked_time.user_id for tracked_time, _, _ in usages})
+    ids = application_cache.ids({app for _, app, _ in usages})
+    old = {(tracked_time_id, application_id): seconds for tracked_time_id, application_id, seconds in
+           AppUsage.objects.filter(tracked_time_id__in={tracked_time.id for tracked_time, _, _ in usages},
+                                   application_id__in=ids.values())
+           .values_list("tracked_time_id", "application_id", "seconds")}
+    AppUsage.objects.bulk_create(
+        [AppUsage(tracked_time=tracked_time, application_id=ids[app], seconds=seconds)
+         for tracked_time, app, seconds in usages],
+        update_conflicts=True, unique_fields=["tracked_time", "application"], update_fields=["seconds"])
+    apply_rollup_deltas([(tracked_time.user_id, tracked_time.date, ids[app],
+                          seconds - old.get((tracked_time.id, ids[app]), 0))
+                         for tracked_time, app, seconds in usages])
+
+
+@transaction.atomic
+def remove_app_usages(usages) -> None:
+    """
+    Delete a queryset of usages and take their seconds out of the rollups.
+    """
+    # The seconds are read once the users are locked, a concurrent write can't make them stale
+    lock_users(set(usages.values_list("tracked_time__user_id", flat=True)))
+    rows = list(usages.values_list("tracked_time__user_id", "tracked_time__date", "application_id", "seconds"))
+    apply_rollup_deltas([(user_id, day, application_id, -seconds) for user_id, day, application_id, seconds in rows])
+    usages.delete()
+
+
+@transaction.atomic
+def merge_alias_usages(alias: Application) -> None:
+    """
+    Move the usages and rollups stored under an alias to the application it is an alias of.
+
+    The seconds of a day that has both are summed, like ApplicationCache.canonical() does.
+    """
+    usages = AppUsage.objects.filter(application_id=alias.id)
+    lock_users(set(usages.values_list("tracked_time__user_id", flat=True)))
+    rows = list(usages.values_list("tracked_time_id", "tracked_time__user_id", "tracked_time__date", "seconds"))
+    if not rows:
+        return
+    totals = {tracked_time_id: seconds for tracked_time_id, _, _, seconds in rows}
+    for tracked_time_id, seconds in AppUsage.objects.filter(application_id=alias.alias_of_id,
+                                                            tracked_time_id__in=totals).values_list(
+            "tracked_time_id", "seconds"):
+        totals[tracked_time_id] += seconds
+    AppUsage.objects.bulk_create(
+        [AppUsage(tracked_time_id=tracked_time_id, application_id=alias.alias_of_id, seconds=seconds)
+         for tracked_time_id, seconds in totals.items()],
+        update_conflicts=True, unique_fields=["tracked_time", "application"], update_fields=["seconds"])
+    usages.delete()
+    AppRollup.objects.filter(application_id=alias.id).delete()
+    apply_rollup_deltas([(user_id, day, alias.alias_of_id, seconds) for _, user_id, day, seconds in rows])
+
+
+class SyncClient(models.Model):
+    """
+    A tracker installation uploading deltas, last_seq is the highest sequence number applied.
+    """
+    user = models.ForeignKey(User, related_name="syncclients", on_delete=models.CASCADE)
+    client_id = models.CharField(max_length=64)
+    last_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "SyncClient"
+        verbose_name_plural = "SyncClients"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "client_id"], name="unique_sync_client"),
+        ]
+    def __str__(self):
+        return f"Sync client {self.client_id}(seq-{self.last_seq}) for user id:{self.user_id}"
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncWeek, TruncMonth, TruncYear
+
+from .models import AppUsage, AppRollup, lock_users
+
+TRUNCATIONS = [(AppRollup.WEEK, TruncWeek), (AppRollup.MONTH, TruncMonth), (AppRollup.YEAR, TruncYear)]
+
+
+def compute_rollups(user_ids=None) -> dict:
+    """
+    Sum the usages of every period in the database.
+
+    Returns {(user_id, period, start, application_id): seconds}, for the given users or all of them.
+    """
+    usages = AppUsage.objects.all()
+    if user_ids is not None:
+        usages = usages.filter(tracked_time__user_id__in=user_ids)
+    rollups = {}
+    for period, truncation in TRUNCATIONS:
+        rows = (usages.annotate(start=truncation('tracked_time__date'))
+                .values_list('tracked_time__user_id', 'start', 'application_id')
+                .annotate(total=Sum('seconds')))
+        for user_id, start, application_id, total in rows:
+            rollups[(user_id, period, start, application_id)] = total
+    rows = usages.values_list('tracked_time__user_id', 'application_id').annotate(total=Sum('seconds'))
+    for user_id, application_id, total in rows:
+        rollups[(user_id, AppRollup.ALL, AppRollup.period_start(AppRollup.ALL, None), application_id)] = total
+    return {key: seconds for key, seconds in rollups.items() if seconds}
+
+
+def stored_rollups(user_ids=None) -> dict:
+    """
+    Read the rollup rows, in the shape of compute_rollups().
+    """
+    rollups = AppRollup.objects.exclude(seconds=0)
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+    return {(user_id, period, start, application_id): seconds for user_id, period, start, application_id, seconds in
+            rollups.values_list('user_id', 'period', 'start', 'application_id', 'seconds')}
+
+
+@transaction.atomic
+def rebuild_rollups(user_ids=None, batch_size: int = 2000) -> int:
+    """
+    Replace the rollups of the given users, or of everyone, with sums of their usages.
+
+    Returns the number of rollup rows written.
+    """
+    if user_ids is not None:
+        lock_users(user_ids)
+        AppRollup.objects.filter(user_id__in=user_ids).delete()
+    else:
+        AppRollup.objects.all().delete()
+    rollups = compute_rollups(user_ids)
+    AppRollup.objects.bulk_create([AppRollup(user_id=user_id, period=period, start=start, application_id=application_id,
+                                             seconds=seconds)
+                                   for (user_id, period, start, application_id), seconds in rollups.items()],
+                                  batch_size=batch_size)
+    return len(rollups)
+
+
+def verify_rollups(user_ids=None) -> list:
+    """
+    Compare the rollup rows with sums of the usages.
+
+    Returns (key, expected seconds, stored seconds) for every rollup that differs.
+    """
+    expected, stored = compute_rollups(user_ids), stored_rollups(user_ids)
+    return [(key, expected.get(key, 0), stored.get(key, 0)) for key in sorted(expected.keys() | stored.keys(), key=str)
+            if expected.get(key, 0) != stored.get(key, 0)]
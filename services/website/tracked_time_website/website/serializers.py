@@ -1,10 +1,83 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import TrackedTime
+from django.db import transaction
+from .models import TrackedTime, application_cache
+from .utils import time_to_seconds
+
+
+class AppsField(serializers.Field):
+    """
+    The usages of a TrackedTime as {app: 'hh:mm:ss'}, the shape of the former apps JSON field.
+
+    Validated input becomes app_seconds, {app: seconds} with aliases resolved.
+    """
+    time_field = serializers.RegexField(r'^\d+:[0-5]\d:[0-5]\d$')
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return value.apps
+
+    def to_internal_value(self, data):
+        if not isinstance(data, dict):
+            raise serializers.ValidationError('Expected a dictionary of apps.')
+        errors, app_seconds = {}, {}
+        for app, time in data.items():
+            try:
+                if not str(app) or len(str(app)) > 255:
+                    raise serializers.ValidationError('App names have 1 to 255 characters.')
+                app_seconds[str(app)] = time_to_seconds(self.time_field.run_validation(time))
+            except serializers.ValidationError as e:
+                errors[app] = e.detail
+        if errors:
+            raise serializers.ValidationError(errors)
+        return {'app_seconds': application_cache.canonical(app_seconds)}
+
 
 class TrackedTimeSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     user_id = serializers.ReadOnlyField(source='user.id')
+    year = serializers.ReadOnlyField(source='date.year')
+    month = serializers.ReadOnlyField(source='date.month')
+    day = serializers.ReadOnlyField(source='date.day')
+    apps = AppsField()
     class Meta:
         model = TrackedTime
-        fields = ['id', 'year', 'month', 'day', 'apps', 'user', 'user_id']
\ No newline at end of file
+        fields = ['id', 'date', 'year', 'month', 'day', 'apps', 'user', 'user_id']
+
+    @transaction.atomic
+    def create(self, validated_data):
+        app_seconds = validated_data.pop('app_seconds')
+        instance = super().create(validated_data)
+        instance.set_app_seconds(app_seconds)
+        return instance
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        # The apps replace the stored ones, like the former JSON field did
+        app_seconds = validated_data.pop('app_seconds', None)
+        instance = super().update(instance, validated_data)
+        if app_seconds is not None:
+            instance.set_app_seconds(app_seconds, replace=True)
+        return instance
+
+class TrackedTimeDeltaSerializer(serializers.Serializer):
+    client_id = serializers.CharField(max_length=64)
+    seq = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    deltas = serializers.DictField(child=serializers.IntegerField(min_value=0))
+
+    def validate_deltas(self, value):
+        if any(not app or len(app) > 255 for app in value):
+            raise serializers.ValidationError('App names have 1 to 255 characters.')
+        return value
+
+
+class TrackedTimeUpsertSerializer(serializers.Serializer):
+    apps = AppsField()
+
+
+class TrackedTimeBulkItemSerializer(TrackedTimeUpsertSerializer):
+    date = serializers.DateField()
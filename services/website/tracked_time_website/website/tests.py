@@ -1,3 +1,170 @@
+from io import StringIO
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import TrackedTime, Application, AppUsage, AppRollup
+from .rollups import verify_rollups
+
+
+class APITestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def put_day(self, date, apps):
+        return self.client.put(f'/api/trackedtime/by-date/{date}/', {'apps': apps}, format='json')
+
+
+class ApplicationAliasTest(APITestCase):
+
+    def test_existing_usages_move_to_the_application_of_an_alias(self):
+        self.put_day('2026-03-10', {'Code - Insiders': '00:10:00', 'Code': '00:05:00'})
+        self.put_day('2026-03-11', {'Code - Insiders': '00:01:00'})
+        alias = Application.objects.get(name='Code - Insiders')
+        alias.alias_of = Application.objects.get(name='Code')
+        alias.save()
+
+        response = self.client.get('/api/trackedtime/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(day['date'], day['apps']) for day in response.data],
+                         [('2026-03-10', {'Code': '00:15:00'}), ('2026-03-11', {'Code': '00:01:00'})])
+        self.assertFalse(AppUsage.objects.filter(application=alias).exists())
+        self.assertFalse(AppRollup.objects.filter(application=alias).exists())
+        self.assertEqual(verify_rollups(), [])
+
+    def test_alias_names_are_stored_under_their_application(self):
+        Application.objects.create(name='Code - Insiders', alias_of=Application.objects.create(name='Code'))
+        self.put_day('2026-03-10', {'Code - Insiders': '00:10:00'})
+        response = self.put_day('2026-03-10', {'Code': '00:04:00', 'Code - Insiders': '00:02:00'})
+        self.assertEqual(response.data['apps'], {'Code': '00:10:00'})
+
+
+class TrackedTimeByDateViewTest(APITestCase):
+
+    def test_put_creates_then_merges_the_day(self):
+        created = self.put_day('2026-03-10', {'code.exe': '01:00:00', 'chrome.exe': '00:10:00'})
+        self.assertEqual(created.status_code, 201)
+        merged = self.put_day('2026-03-10', {'code.exe': '00:30:00', 'chrome.exe': '00:20:00', 'slack.exe': '00:00:01'})
+        self.assertEqual(merged.status_code, 200)
+        self.assertEqual(merged.data['id'], created.data['id'])
+        # The larger time of every app wins, apps missing from the request are kept
+        self.assertEqual(merged.data['apps'], {'code.exe': '01:00:00', 'chrome.exe': '00:20:00',
+                                               'slack.exe': '00:00:01'})
+        self.assertEqual(self.put_day('2026-03-10', {}).data['apps'], merged.data['apps'])
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.put_day('2026-02-30', {'code.exe': '00:00:01'}).status_code, 400)
+        self.assertEqual(self.put_day('2026-03-10', {'code.exe': '1 hour'}).status_code, 400)
+        self.assertEqual(self.put_day('2026-03-10', {'': '00:00:01'}).status_code, 400)
+        self.assertFalse(TrackedTime.objects.exists())
+
+
+class TrackedTimeBulkViewTest(APITestCase):
+    url = '/api/trackedtime/bulk/'
+
+    def test_every_record_gets_a_status(self):
+        self.put_day('2026-03-10', {'code.exe': '01:00:00'})
+        response = self.client.post(self.url, [
+            {'date': '2026-03-10', 'apps': {'code.exe': '00:30:00', 'chrome.exe': '00:01:00'}},
+            {'date': '2026-03-11', 'apps': {'code.exe': '00:00:05'}},
+            {'date': '2026-03-11', 'apps': {'code.exe': '00:00:07'}},
+            {'date': 'yesterday', 'apps': {}},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(result['index'], result['status']) for result in response.data],
+                         [(0, 'updated'), (1, 'created'), (2, 'created'), (3, 'invalid')])
+        self.assertIn('date', response.data[3]['errors'])
+        days = {str(t.date): t.apps for t in TrackedTime.objects.filter(user=self.user)}
+        self.assertEqual(days, {'2026-03-10': {'code.exe': '01:00:00', 'chrome.exe': '00:01:00'},
+                                '2026-03-11': {'code.exe': '00:00:07'}})
+
+    def test_ndjson_lines_are_read_one_by_one(self):
+        body = b'{"date": "2026-03-10", "apps": {"code.exe": "00:00:01"}}\n\nnot json\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data], ['created', 'invalid'])
+
+    def test_records_must_be_a_list(self):
+        response = self.client.post(self.url, {'date': '2026-03-10'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TrackedTimeDeltaViewTest(APITestCase):
+
+    def post_delta(self, client_id, seq, deltas, date='2026-03-10'):
+        return self.client.post('/api/trackedtime/delta/',
+                                {'client_id': client_id, 'seq': seq, 'date': date, 'deltas': deltas}, format='json')
+
+    def test_resent_delta_is_applied_once(self):
+        first = self.post_delta('laptop', 1, {'code.exe': 65})
+        again = self.post_delta('laptop', 1, {'code.exe': 65})
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.data['applied'])
+        self.assertFalse(again.data['applied'])
+        self.assertEqual(again.data['seq'], 1)
+        self.assertEqual(again.data['apps'], {'code.exe': '00:01:05'})
+
+    def test_deltas_of_several_clients_add_up(self):
+        self.post_delta('laptop', 1, {'code.exe': 60})
+        self.post_delta('desktop', 1, {'code.exe': 30, 'chrome.exe': 5})
+        response = self.post_delta('laptop', 2, {'code.exe': 1})
+        self.assertEqual(response.data['apps'], {'code.exe': '00:01:31', 'chrome.exe': '00:00:05'})
+        self.assertEqual(TrackedTime.objects.filter(user=self.user).count(), 1)
+
+    def test_invalid_app_names_are_rejected(self):
+        for app in ['', 'x' * 256]:
+            response = self.post_delta('laptop', 1, {app: 1})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('deltas', response.data)
+        self.assertFalse(TrackedTime.objects.exists())
+
+
+class AppRollupTest(APITestCase):
+
+    def totals(self, period, date):
+        return self.client.get('/api/trackedtime/totals/', {'period': period, 'date': date}).data
+
+    def test_rollups_follow_every_write(self):
+        self.put_day('2026-03-09', {'code.exe': '01:00:00', 'chrome.exe': '00:10:00'})
+        self.client.post('/api/trackedtime/bulk/', [{'date': '2026-03-10', 'apps': {'code.exe': '00:30:00'}},
+                                                   {'date': '2025-12-31', 'apps': {'slack.exe': '00:00:05'}}],
+                         format='json')
+        self.client.post('/api/trackedtime/delta/', {'client_id': 'laptop', 'seq': 1, 'date': '2026-03-10',
+                                                     'deltas': {'chrome.exe': 20}}, format='json')
+        monday = TrackedTime.objects.get(date='2026-03-09')
+        self.client.patch(f'/api/trackedtime/{monday.pk}/', {'apps': {'code.exe': '02:00:00'}}, format='json')
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(self.totals('week', '2026-03-15')['apps'], {'code.exe': '02:30:00', 'chrome.exe': '00:00:20'})
+        self.assertEqual(self.totals('year', '2025-06-01')['apps'], {'slack.exe': '00:00:05'})
+        self.assertEqual(self.totals('all', '2026-03-10')['apps'],
+                         {'code.exe': '02:30:00', 'chrome.exe': '00:00:20', 'slack.exe': '00:00:05'})
+
+        self.client.delete(f'/api/trackedtime/{monday.pk}/')
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(self.totals('month', '2026-03-01')['apps'], {'code.exe': '00:30:00', 'chrome.exe': '00:00:20'})
+
+    def test_admin_bulk_delete_keeps_the_rollups(self):
+        self.put_day('2026-03-09', {'code.exe': '01:00:00'})
+        self.put_day('2026-03-10', {'code.exe': '00:01:00'})
+        tracked_time_admin = admin.site._registry[TrackedTime]
+        tracked_time_admin.delete_queryset(None, TrackedTime.objects.filter(date='2026-03-09'))
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(self.totals('all', '2026-03-10')['apps'], {'code.exe': '00:01:00'})
 
-# Create your tests here.
+    def test_command_verifies_and_rebuilds(self):
+        self.put_day('2026-03-09', {'code.exe': '01:00:00'})
+        AppRollup.objects.filter(period=AppRollup.WEEK).update(seconds=1)
+        AppRollup.objects.filter(period=AppRollup.ALL).delete()
+        self.assertEqual(len(verify_rollups()), 2)
+        with self.assertRaises(CommandError):
+            call_command('rollups', 'verify', stdout=StringIO())
+        call_command('rollups', 'rebuild', stdout=StringIO())
+        call_command('rollups', 'verify', '--user', str(self.user.pk), stdout=StringIO())
+        self.assertEqual(verify_rollups(), [])
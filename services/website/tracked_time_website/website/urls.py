@@ -6,6 +6,10 @@ from .views import *
 urlpatterns = [
     path('', IndexView.as_view(), name="index"),
     path('api/trackedtime/', TrackedTimeListView.as_view()),
+    path('api/trackedtime/by-date/<str:date>/', TrackedTimeByDateView.as_view()),
+    path('api/trackedtime/bulk/', TrackedTimeBulkView.as_view()),
+    path('api/trackedtime/delta/', TrackedTimeDeltaView.as_view()),
+    path('api/trackedtime/totals/', TrackedTimeTotalsView.as_view()),
     path('api/trackedtime/<int:pk>/', TrackedTimeDetailView.as_view()),
     path('apps/', AppsView.as_view(), name="apps"),
 ]
\ No newline at end of file
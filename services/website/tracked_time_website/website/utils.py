@@ -0,0 +1,32 @@
+def time_to_seconds(time: str) -> int:
+    """
+    Get seconds from a hh:mm:ss string.
+    """
+    hours, minutes, seconds = map(int, time.split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def seconds_to_time(seconds: int) -> str:
+    """
+    Format seconds as a hh:mm:ss string, hours may exceed 24.
+    """
+    return '{:02}:{:02}:{:02}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def add_app_seconds(totals: dict, deltas: dict) -> dict:
+    """
+    Add per-app deltas to per-app totals, both in seconds.
+
+    Returns the new totals of the apps in deltas.
+    """
+    return {app: totals.get(app, 0) + seconds for app, seconds in deltas.items()}
+
+
+def merge_app_seconds(totals: dict, incoming: dict) -> dict:
+    """
+    Merge per-app totals in seconds, the larger time of an app wins.
+
+    Day totals only grow, so resending or reordering the same totals never
+    lowers a stored time. Returns the new totals of the apps that changed.
+    """
+    return {app: seconds for app, seconds in incoming.items() if seconds > totals.get(app, 0)}
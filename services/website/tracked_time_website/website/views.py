@@ -1,10 +1,11 @@
 from typing import Any
 from django.shortcuts import render
-from django.views.generic import TemplateView, ListView
+from django.views.generic import TemplateView
 from django.contrib.auth.models import User
 from django.http import Http404
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
+from django.utils import timezone
 
 from rest_framework import status 
 from rest_framework.response import Response
@@ -14,49 +15,50 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
-from collections import defaultdict
+from django.db import transaction
 from datetime import timedelta
+import json
 
-from .serializers import TrackedTimeSerializer
-from .models import TrackedTime
+from rest_framework import serializers
+from .serializers import (TrackedTimeSerializer, TrackedTimeDeltaSerializer, TrackedTimeUpsertSerializer,
+                          TrackedTimeBulkItemSerializer)
+from .models import TrackedTime, SyncClient, AppRollup, lock_users, upsert_app_usages, application_cache
 from .permissions import IsOwnerOrRestricted
+from .filters import TrackedTimeFilter
+from .utils import add_app_seconds, merge_app_seconds, seconds_to_time
 
 
 class IndexView(TemplateView):
     template_name = "website/index.html"
 
 
-class AppsView(LoginRequiredMixin, ListView):
-    model = TrackedTime 
+class AppsView(LoginRequiredMixin, TemplateView):
+    """
+    All time tracked by the user per app.
+
+    The totals are read from the user's all time rollups, one row per app.
+    """
     login_url = reverse_lazy('login')
     template_name = "website/time_data.html"
-    context_object_name = "apps_data"
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        all_apps = context["apps_data"]
-        apps_data = defaultdict(lambda: timedelta())
-        for elem in all_apps:
-            if elem.user.id == self.request.user.id:
-                for app, time in elem.apps.items():
-                    hours, minutes, seconds = map(int, time.split(':'))
-                    apps_data[app] += timedelta(hours=hours, minutes=minutes, seconds=seconds)
-        for key in apps_data:
-            apps_data[key] = str(apps_data[key])
-        apps_data = dict(apps_data)
-        context["apps_data"] = apps_data
+        totals = (AppRollup.objects
+                  .filter(user=self.request.user, period=AppRollup.ALL, seconds__gt=0)
+                  .order_by('-seconds')
+                  .values_list('application__name', 'seconds'))
+        context["apps_data"] = {name: str(timedelta(seconds=seconds)) for name, seconds in totals}
         return context
 
 
-
 class TrackedTimeListView(ListCreateAPIView):
     authentication_classes = [SessionAuthentication, JWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = TrackedTimeSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['day', 'month', 'year']
+    filterset_class = TrackedTimeFilter
     def get_queryset(self):
         user = self.request.user
-        return user.trackedtimes.all()
+        return user.trackedtimes.prefetch_related('usages')
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     # def get(self, request):
@@ -70,6 +72,31 @@ class TrackedTimeListView(ListCreateAPIView):
     #         return Response(serializer.data, status=status.HTTP_201_CREATED)
     #     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+class TrackedTimeTotalsView(APIView):
+    """
+    Time tracked per app over a week, month, year or all time.
+
+    GET ?period=week|month|year|all&date=yyyy-mm-dd, the period containing the
+    date, today by default. The totals are read from the user's rollups, one
+    row per app whatever the length of the period.
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        period = serializers.ChoiceField(choices=AppRollup.PERIODS).run_validation(
+            request.query_params.get('period', AppRollup.ALL))
+        day = serializers.DateField().run_validation(request.query_params.get('date', str(timezone.localdate())))
+        start = AppRollup.period_start(period, day)
+        totals = (AppRollup.objects
+                  .filter(user=request.user, period=period, start=start, seconds__gt=0)
+                  .order_by('-seconds')
+                  .values_list('application__name', 'seconds'))
+        return Response({'period': period, 'start': None if period == AppRollup.ALL else start,
+                         'apps': {name: seconds_to_time(seconds) for name, seconds in totals}})
+
+
 # TODO: REWRITE TO GENERIC VIEWS
 class TrackedTimeDetailView(APIView):
     authentication_classes = [SessionAuthentication, JWTAuthentication]
@@ -77,7 +104,7 @@ class TrackedTimeDetailView(APIView):
 
     def get_object(self, pk):
         try:
-            return TrackedTime.objects.get(pk=pk)
+            return TrackedTime.objects.prefetch_related('usages').get(pk=pk)
         except TrackedTime.DoesNotExist:
             raise Http404
 
@@ -98,4 +125,150 @@ class TrackedTimeDetailView(APIView):
     def delete(self, request, pk):
         TrackedTime = self.get_object(pk)
         TrackedTime.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TrackedTimeByDateView(APIView):
+    """
+    Create or merge the tracked time of a day in one request.
+
+    The row of the day is looked up and written while the user is locked, so
+    concurrent uploads of the same user can't lose each other's apps. The
+    merge needs the stored seconds of the day, so the row is read and then
+    written rather than upserted in one statement, the unique (user, date)
+    constraint only guards against a second row.
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, date):
+        date = serializers.DateField().run_validation(date)
+        serializer = TrackedTimeUpsertSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            lock_users({request.user.pk})
+            tracked_time, created = request.user.trackedtimes.get_or_create(date=date)
+            tracked_time.set_app_seconds(merge_app_seconds(tracked_time.app_seconds,
+                                                           serializer.validated_data['app_seconds']))
+        return Response(TrackedTimeSerializer(tracked_time).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class TrackedTimeBulkView(APIView):
+    """
+    Create or merge the tracked time of many days in one request.
+
+    The body is either a JSON array of {"date", "apps"} records or, with the
+    application/x-ndjson content type, one record per line. NDJSON bodies are
+    read line by line, so memory only grows with chunk_size. Every record is
+    validated and the valid ones are merged like TrackedTimeByDateView does,
+    chunk by chunk with bulk inserts and upserts inside a single transaction.
+    The response lists the status of every record in the order received.
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    chunk_size = 500
+
+    def _records(self, request):
+        if request.content_type.startswith('application/x-ndjson'):
+            for line in request.stream or ():
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield e
+        else:
+            records = request.data
+            if not isinstance(records, list):
+                raise serializers.ValidationError('Expected a list of records.')
+            yield from records
+
+    def _write_chunk(self, user, chunk, results):
+        days = {}
+        for index, record in chunk:
+            if isinstance(record, Exception):
+                results.append({'index': index, 'status': 'invalid', 'errors': ['Invalid JSON.']})
+                continue
+            serializer = TrackedTimeBulkItemSerializer(data=record)
+            if not serializer.is_valid():
+                results.append({'index': index, 'status': 'invalid', 'errors': serializer.errors})
+            else:
+                date = serializer.validated_data['date']
+                # Records of the same day are merged before they reach the db
+                day = days.setdefault(date, {})
+                day.update(merge_app_seconds(day, serializer.validated_data['app_seconds']))
+                results.append({'index': index, 'date': str(date)})
+        if not days:
+            return
+        existing = {t.date: t for t in user.trackedtimes.prefetch_related('usages').filter(date__in=days)}
+        to_create, tracked_times, statuses = [], {}, {}
+        for date in days:
+            tracked_time = existing.get(date)
+            if tracked_time is None:
+                tracked_time = TrackedTime(user=user, date=date)
+                to_create.append(tracked_time)
+                statuses[str(date)] = 'created'
+            else:
+                statuses[str(date)] = 'updated'
+            tracked_times[date] = tracked_time
+        TrackedTime.objects.bulk_create(to_create)
+        usages = []
+        for date, app_seconds in days.items():
+            tracked_time = tracked_times[date]
+            current = tracked_time.app_seconds if statuses[str(date)] == 'updated' else {}
+            usages += [(tracked_time, app, seconds) for app, seconds in merge_app_seconds(current, app_seconds).items()]
+        upsert_app_usages(usages)
+        for result in results[-len(chunk):]:
+            if 'date' in result:
+                result['status'] = statuses[result['date']]
+
+    def post(self, request):
+        results, chunk = [], []
+        with transaction.atomic():
+            # Serializes the writes of one user, see TrackedTimeByDateView
+            lock_users({request.user.pk})
+            for index, record in enumerate(self._records(request)):
+                chunk.append((index, record))
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(request.user, chunk, results)
+                    chunk = []
+            self._write_chunk(request.user, chunk, results)
+        return Response(results)
+
+
+class TrackedTimeDeltaView(APIView):
+    """
+    Add per-app seconds to the tracked time of a day.
+
+    Every client numbers its deltas, a delta with a sequence number that was
+    already applied is acknowledged without being added again, so clients can
+    safely resend after a lost response. The user is locked while the day is
+    read and written, so deltas of several machines add up.
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TrackedTimeDeltaSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        date = data['date']
+        with transaction.atomic():
+            # Locking the user serializes the deltas of all the user's clients, no addition is lost
+            lock_users({request.user.pk})
+            client, _ = SyncClient.objects.get_or_create(user=request.user, client_id=data['client_id'])
+            tracked_time = request.user.trackedtimes.filter(date=date).first()
+            applied = data['seq'] > client.last_seq
+            if applied:
+                if tracked_time is None:
+                    tracked_time, _ = request.user.trackedtimes.get_or_create(date=date)
+                deltas = application_cache.canonical(data['deltas'])
+                tracked_time.set_app_seconds(add_app_seconds(tracked_time.app_seconds, deltas))
+                client.last_seq = data['seq']
+                client.save(update_fields=['last_seq'])
+        response = TrackedTimeSerializer(tracked_time).data if tracked_time is not None else {}
+        response['applied'] = applied
+        response['seq'] = client.last_seq
+        return Response(response)